@@ -1,7 +1,35 @@
-from django.contrib import admin
+import csv
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Dorm, Block, Room, OtherInfo , Notice
+from .models import User, Dorm, Block, Room, OtherInfo , Notice, SelectionCohort
+from .allocation import allocate_students, release_students
+from .exports import FORMATS, export_response
+from .forms import PaymentReconciliationForm, fix_numbers
+from .live import publish_rooms
+from .payments import reconcile_payments
+from .routing import pin_to_primary, read_alias_for, replica_reads
+from .spreadsheets import iter_rows
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django import forms
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.shortcuts import redirect
 from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
+from django.urls import path
+
+
+class WebDormAutocompleteJsonView(AutocompleteJsonView):
+    def serialize_result(self, obj, to_field_name):
+        result = super().serialize_result(obj, to_field_name)
+        if isinstance(obj, Room):
+            result['text'] = f"{obj} ({obj.free_capacity} جای خالی)"
+        return result
+
 
 class WebDormAdminSite(admin.AdminSite):
     site_header = 'پنل مدیریت خوابگاه'
@@ -13,10 +41,13 @@ class WebDormAdminSite(admin.AdminSite):
         for app in app_list:
             if app['app_label'] == 'myapp':
                 app['name'] = 'مدیریت خوابگاه'
-                custom_order = ['User', 'Dorm', 'Block', 'Room','Notice' 'OtherInfo']
+                custom_order = ['User', 'Dorm', 'Block', 'Room', 'Notice', 'OtherInfo', 'SelectionCohort']
                 app['models'].sort(key=lambda x: custom_order.index(x['object_name']) if x['object_name'] in custom_order else len(custom_order))
         return app_list
 
+    def autocomplete_view(self, request):
+        return WebDormAutocompleteJsonView.as_view(admin_site=self)(request)
+
 super_admin_site = WebDormAdminSite(name='webdorm_admin')
 
 class FloorFilter(admin.SimpleListFilter):
@@ -24,8 +55,7 @@ class FloorFilter(admin.SimpleListFilter):
     parameter_name = 'floor'
 
     def lookups(self, request, model_admin):
-        floors = sorted(set(Room.objects.values_list('floor_number', flat=True)))
-        return [(f, f"طبقه {f}") for f in floors]
+        return [(f, f"طبقه {f}") for f in Room.floor_numbers()]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -33,17 +63,192 @@ class FloorFilter(admin.SimpleListFilter):
         return queryset
 
 
+class BlockFieldListFilter(admin.RelatedFieldListFilter):
+    #Block.__str__ esm khabgah ro ham mikhad; bedoon select_related be ezaye har block ye query mizad
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        blocks = Block.objects.select_related('placed_in')
+        if ordering:
+            blocks = blocks.order_by(*ordering)
+        return [(block.pk, str(block)) for block in blocks]
+
+
+class ReplicaChangelistMixin:
+    #list (GET) az replica; har POST (save / delete / action) rooye primary va admin pin mishe
+    def changelist_view(self, request, extra_context=None):
+        if request.method == 'POST':
+            pin_to_primary(request)
+            return super().changelist_view(request, extra_context)
+        return replica_reads(super().changelist_view)(request, extra_context)
+
+    def changeform_view(self, request, *args, **kwargs):
+        if request.method == 'POST':
+            pin_to_primary(request)
+        return super().changeform_view(request, *args, **kwargs)
+
+    def delete_view(self, request, *args, **kwargs):
+        if request.method == 'POST':
+            pin_to_primary(request)
+        return super().delete_view(request, *args, **kwargs)
+
+
+class StreamingExportMixin:
+    #export kol list (ba hamoon filter / jostojoo-ye changelist) be CSV / XLSX
+    export_columns = ()
+    export_filename = 'export'
+    change_list_template = 'admin/export_change_list.html'
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        urls = [
+            path('export/<str:file_format>/', self.admin_site.admin_view(self.export_view), name='%s_%s_export' % info),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request, file_format):
+        if file_format not in FORMATS:
+            raise Http404
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            changelist = self.get_changelist_instance(request)
+        except IncorrectLookupParameters:
+            return redirect(f'{self.admin_site.name}:{self.opts.app_label}_{self.opts.model_name}_changelist')
+        queryset = changelist.queryset.using(read_alias_for(request))
+        return export_response(request, queryset, self.export_columns, self.export_filename, file_format)
+
+
 @admin.register(User, site=super_admin_site)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(ReplicaChangelistMixin, StreamingExportMixin, UserAdmin):
 
     list_display = ('first_name', 'last_name', 'student_code', 'get_room_number', 'payed_cost', 'is_staff')
 
-    list_filter = ('is_superuser', 'placed_in__placed_in', 'placed_in__placed_in__placed_in','payed_cost')
+    list_filter = ('is_superuser', ('placed_in__placed_in', BlockFieldListFilter), 'placed_in__placed_in__placed_in','payed_cost')
+    list_select_related = ('placed_in__placed_in',)
 
     search_fields = ('username', 'first_name', 'last_name', 'national_code', 'student_code')
 
-    fieldsets = UserAdmin.fieldsets + (('اطلاعات دانشجویی', {'fields': ('national_code', 'student_code', 'placed_in', 'payed_cost')}),) # type: ignore
-    add_fieldsets = UserAdmin.add_fieldsets + (('اطلاعات دانشجویی', {'fields': ('national_code', 'student_code', 'placed_in', 'payed_cost')}),)
+    #bejaye select hame otagh ha; jostojoo bar asas khabgah / block / shomare otagh
+    autocomplete_fields = ('placed_in',)
+
+    fieldsets = UserAdmin.fieldsets + (('اطلاعات دانشجویی', {'fields': ('national_code', 'student_code', 'gender', 'placed_in', 'payed_cost')}),) # type: ignore
+    add_fieldsets = UserAdmin.add_fieldsets + (('اطلاعات دانشجویی', {'fields': ('national_code', 'student_code', 'gender', 'placed_in', 'payed_cost')}),)
+
+    actions = ['allocate_rooms_preview', 'allocate_rooms', 'mark_paid', 'mark_unpaid', 'release_from_room', 'move_to_block']
+    change_list_template = 'admin/user_change_list.html'
+
+    export_filename = 'placements'
+    export_columns = (
+        ('student_code', 'شماره دانشجویی'),
+        ('first_name', 'نام'),
+        ('last_name', 'نام خانوادگی'),
+        ('national_code', 'کد ملی'),
+        ('placed_in__placed_in__placed_in__name', 'خوابگاه'),
+        ('placed_in__placed_in__name', 'بلوک'),
+        ('placed_in__floor_number', 'طبقه'),
+        ('placed_in__number', 'شماره اتاق'),
+        ('placed_in__room_cost', 'هزینه اتاق'),
+        ('payed_cost', 'پرداخت شده'),
+    )
+
+    @admin.action(description='پیش‌نمایش تخصیص خودکار اتاق به دانشجویان انتخاب شده')
+    def allocate_rooms_preview(self, request, queryset):
+        report = allocate_students(queryset, dry_run=True)
+        messages.add_message(request, messages.WARNING if report.unknown_gender else messages.INFO, " | ".join(report.summary_lines()))
+
+    @admin.action(description='تخصیص خودکار اتاق به دانشجویان انتخاب شده (پرداخت‌کرده و بدون اتاق)')
+    def allocate_rooms(self, request, queryset):
+        report = allocate_students(queryset)
+        #daneshjoo bedoon jensiat bi sar o seda jamande nashe
+        messages.add_message(request, messages.WARNING if report.unknown_gender else messages.SUCCESS, " | ".join(report.summary_lines()))
+
+    #action haye dasteyi: har kodoom chand query set-based (na save be ezaye har daneshjoo)
+    @admin.action(description='علامت زدن به عنوان پرداخت‌کرده')
+    def mark_paid(self, request, queryset):
+        updated = queryset.filter(payed_cost=False).update(payed_cost=True)
+        messages.success(request, f"{updated} دانشجو به عنوان پرداخت‌کرده علامت خورد.")
+
+    @admin.action(description='علامت زدن به عنوان پرداخت‌نکرده')
+    def mark_unpaid(self, request, queryset):
+        updated = queryset.filter(payed_cost=True).update(payed_cost=False)
+        messages.success(request, f"{updated} دانشجو به عنوان پرداخت‌نکرده علامت خورد.")
+
+    @admin.action(description='خارج کردن دانشجویان انتخاب شده از اتاق')
+    def release_from_room(self, request, queryset):
+        rooms = release_students(queryset)
+        publish_rooms(list(rooms))
+        messages.success(request, f"دانشجویان از {len(rooms)} اتاق خارج شدند.")
+
+    @admin.action(description='انتقال دانشجویان انتخاب شده به یک بلوک')
+    def move_to_block(self, request, queryset):
+        #safhe vasat baraye entekhab block; hame ya hich (agar ja baraye hame nabashe hichi avaz nemishe)
+        block = Block.objects.filter(pk=request.POST.get('block') or None).first() if 'apply' in request.POST else None
+        if block is None:
+            return TemplateResponse(request, 'admin/move_to_block.html', {
+                **self.admin_site.each_context(request),
+                'opts': self.opts,
+                'title': 'انتقال دانشجویان به بلوک',
+                'blocks': Block.objects.select_related('placed_in').filter(is_active=True),
+                'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0'),
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            })
+
+        students = queryset.exclude(placed_in__placed_in=block)
+        with transaction.atomic():
+            total = students.count()
+            released = release_students(students)
+            report = allocate_students(students, block=block)
+            if report.placed_count < total:
+                transaction.set_rollback(True)
+        if report.placed_count < total:
+            reasons = " | ".join(report.summary_lines()[1:]) or "دانشجوی پرداخت‌نکرده یا کارمند در انتخاب است"
+            messages.error(request, f"جا برای همه {total} دانشجو در بلوک {block} نیست؛ هیچ تغییری ذخیره نشد. ({reasons})")
+            return None
+        publish_rooms(list(released | report.rooms_used))
+        messages.success(request, f"{total} دانشجو به بلوک {block} منتقل شدند.")
+
+    def get_urls(self):
+        urls = [
+            path('reconcile-payments/', self.admin_site.admin_view(self.reconcile_payments_view), name='myapp_user_reconcile_payments'),
+        ]
+        return urls + super().get_urls()
+
+    def reconcile_payments_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        report = None
+        form = PaymentReconciliationForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                report = reconcile_payments(iter_rows(upload, upload.name), dry_run=form.cleaned_data['dry_run'])
+            except (ValueError, csv.Error) as exc:
+                form.add_error('file', str(exc))
+        return TemplateResponse(request, 'admin/payment_reconcile.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'تطبیق پرداخت ها با فایل واحد پرداخت',
+            'form': form,
+            'report': report,
+        })
+
+    def save_model(self, request, obj, form, change):
+        #placed_in ro az masir move_to_room avaz mikonim ta shomarande otagh ha dorost bemune
+        # (User.save baraye karbar mojood placed_in ro nemineviseh; inja baraye karbar jadid ham lazem ast)
+        room_changed = 'placed_in' in form.changed_data
+        target_room = obj.placed_in
+        if room_changed:
+            obj.placed_in_id = form.initial.get('placed_in')
+        super().save_model(request, obj, form, change)
+        if room_changed and not obj.move_to_room(target_room):
+            messages.error(request, f"ظرفیت اتاق {target_room.number} تکمیل است؛ محل دانشجو تغییر نکرد.")
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'placed_in':
+            #label otagh entekhab shode ba yek query join sakhte mishe
+            kwargs['queryset'] = Room.objects.select_related('placed_in__placed_in')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     @admin.display(description='شماره اتاق')
     def get_room_number(self, obj):
@@ -53,38 +258,122 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(Dorm, site=super_admin_site)
-class DormAdmin(admin.ModelAdmin):
+class DormAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('name', 'gender', 'total_capacity_display', 'current_population_display', 'is_active')
 
     list_editable = ('is_active',)
 
-    @admin.display(description='ظرفیت کل')
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_occupancy()
+
+    @admin.display(description='ظرفیت کل', ordering='capacity_sum')
     def total_capacity_display(self, obj): return obj.total_capacity
 
-    @admin.display(description='ساکنین فعلی')
+    @admin.display(description='ساکنین فعلی', ordering='population_sum')
     def current_population_display(self, obj): return obj.current_population
 
 
+def parse_floors(text):
+    #"1,3-5" -> [1, 3, 4, 5]; khali -> None (hame tabaghat)
+    floors = set()
+    for part in filter(None, (p.strip() for p in fix_numbers(text).split(','))):
+        start, _, end = part.partition('-')
+        if not start.isdigit() or (end and not end.isdigit()):
+            raise ValidationError("طبقات را به شکل 1,3-5 وارد کنید.")
+        floors.update(range(int(start), int(end or start) + 1))
+    return sorted(floors) or None
+
+
+class BlockAdminForm(forms.ModelForm):
+    #taghirat block ba in gozine ha ba yek UPDATE rooye otagh haye mojood ham emal mishe
+    apply_cost_to_rooms = forms.BooleanField(label='اعمال هزینه روی اتاق های موجود', required=False)
+    apply_capacity_to_rooms = forms.BooleanField(label='اعمال ظرفیت پیش‌فرض روی اتاق های موجود', required=False)
+    rooms_active = forms.ChoiceField(
+        label='فعال بودن اتاق های موجود', required=False,
+        choices=[('', 'بدون تغییر'), ('1', 'همه فعال'), ('0', 'همه غیرفعال')],
+    )
+    floors = forms.CharField(label='فقط این طبقات', required=False, help_text='مثلا 1,3-5 ؛ خالی = همه طبقات')
+
+    class Meta:
+        model = Block
+        fields = '__all__'
+
+    def clean_floors(self):
+        return parse_floors(self.cleaned_data['floors'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        capacity = cleaned_data.get('default_room_capacity')
+        if self.instance.pk and cleaned_data.get('apply_capacity_to_rooms') and capacity is not None:
+            rooms = self.instance.room_set.filter(current_occupancy__gt=capacity - F('held_count'))
+            if cleaned_data.get('floors'):
+                rooms = rooms.filter(floor_number__in=cleaned_data['floors'])
+            crowded = list(rooms.order_by('number').values_list('number', flat=True)[:20])
+            if crowded:
+                self.add_error('default_room_capacity', f"این اتاق ها بیشتر از {capacity} ساکن دارند: {', '.join(map(str, crowded))}")
+        return cleaned_data
+
+    def room_changes(self):
+        data = self.cleaned_data
+        return {
+            'floors': data.get('floors'),
+            'room_cost': data['room_costs'] if data.get('apply_cost_to_rooms') else None,
+            'capacity': data['default_room_capacity'] if data.get('apply_capacity_to_rooms') else None,
+            'is_active': {'1': True, '0': False}.get(data.get('rooms_active')),
+        }
+
+
 @admin.register(Block, site=super_admin_site)
-class BlockAdmin(admin.ModelAdmin):
+class BlockAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
 
     list_display = ('name', 'placed_in', 'floor_count', 'total_capacity_display', 'occupied_display', 'supervisor', 'is_active')
 
     list_filter = ('placed_in',)
     search_fields = ('name', 'supervisor__username')
-
-    @admin.display(description='ظرفیت بلوک')
+    list_select_related = ('placed_in', 'supervisor')
+
+    form = BlockAdminForm
+    actions = ['clone_blocks']
+    ROOM_UPDATE_FIELDS = ('apply_cost_to_rooms', 'apply_capacity_to_rooms', 'rooms_active', 'floors')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_occupancy()
+
+    def get_fields(self, request, obj=None):
+        #block jadid hanooz otagh nadare
+        fields = super().get_fields(request, obj)
+        if obj is None:
+            fields = [field for field in fields if field not in self.ROOM_UPDATE_FIELDS]
+        return fields
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            try:
+                updated = obj.update_rooms(**form.room_changes())
+            except ValidationError as exc:
+                messages.error(request, f"تغییرات اتاق ها اعمال نشد: {exc.messages[0]}")
+            else:
+                if updated:
+                    messages.info(request, f"{updated} اتاق بروزرسانی شد.")
+
+    @admin.action(description='کپی بلوک های انتخاب شده (با همان چیدمان اتاق ها، بدون ساکنین)')
+    def clone_blocks(self, request, queryset):
+        for block in queryset.select_related('placed_in'):
+            block.clone(name=f"{block.name} (کپی)")
+        messages.success(request, f"{len(queryset)} بلوک کپی شد.")
+
+    @admin.display(description='ظرفیت بلوک', ordering='capacity_sum')
     def total_capacity_display(self, obj): return obj.total_capacity
 
-    @admin.display(description='تعداد ساکنین')
+    @admin.display(description='تعداد ساکنین', ordering='population_sum')
     def occupied_display(self, obj): return obj.current_population
 
 
 class StudentInlineFormSet(BaseInlineFormSet):
     def delete_existing(self, obj, commit=True):
         if commit:
-            obj.placed_in = None
-            obj.save()
+            obj.move_to_room(None)
 
 
 class StudentInline(admin.TabularInline):
@@ -99,17 +388,34 @@ class StudentInline(admin.TabularInline):
     verbose_name_plural = "لیست دانشجویان (با تیک زدن حذف، دانشجو فقط از اتاق خارج می‌شود)"
 
 @admin.register(Room, site=super_admin_site)
-class RoomAdmin(admin.ModelAdmin):
+class RoomAdmin(ReplicaChangelistMixin, StreamingExportMixin, admin.ModelAdmin):
 
     list_display = ('number', 'get_floor_display', 'get_dorm_name', 'placed_in', 'capacity', 'occupancy_display', 'is_active')
     
-    list_filter = ('placed_in__placed_in', 'placed_in', FloorFilter, 'is_active')
+    list_filter = ('placed_in__placed_in', ('placed_in', BlockFieldListFilter), FloorFilter, 'is_active')
     
-    search_fields = ('number',)
+    search_fields = ('number', 'placed_in__name', 'placed_in__placed_in__name')
     list_per_page = 20
+    list_select_related = ('placed_in__placed_in',)
 
     inlines = [StudentInline]
 
+    export_filename = 'occupancy'
+    export_columns = (
+        ('placed_in__placed_in__name', 'خوابگاه'),
+        ('placed_in__name', 'بلوک'),
+        ('floor_number', 'طبقه'),
+        ('number', 'شماره اتاق'),
+        ('capacity', 'ظرفیت'),
+        ('current_occupancy', 'تعداد ساکنین'),
+        ('room_cost', 'هزینه'),
+        ('is_active', 'فعال'),
+    )
+
+    def get_queryset(self, request):
+        #baraye autocomplete ham (label otagh esm block va khabgah ro mikhad)
+        return super().get_queryset(request).select_related('placed_in__placed_in')
+
     @admin.display(description='طبقه', ordering='floor_number')
     def get_floor_display(self, obj):
         return f"طبقه {obj.floor_number}"
@@ -117,17 +423,51 @@ class RoomAdmin(admin.ModelAdmin):
     @admin.display(description='خوابگاه', ordering='placed_in__placed_in')
     def get_dorm_name(self, obj): return obj.placed_in.placed_in.__str__()
 
-    @admin.display(description='پر شده')
+    @admin.display(description='پر شده', ordering='current_occupancy')
     def occupancy_display(self, obj): return obj.current_occupancy
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'placed_in':
+            kwargs['queryset'] = Block.objects.select_related('placed_in')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 @admin.register(OtherInfo, site=super_admin_site)
 class OtherInfoAdmin(admin.ModelAdmin):
     list_display = ('start_selectroom_event', 'end_selectroom_event')
     def has_add_permission(self, request): return not OtherInfo.objects.exists()
 
+@admin.register(SelectionCohort, site=super_admin_site)
+class SelectionCohortAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'value', 'priority', 'start_selectroom_event', 'end_selectroom_event')
+    list_editable = ('priority',)
+    change_list_template = 'admin/selection_cohort_change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('preview/', self.admin_site.admin_view(self.preview_view), name='myapp_selectioncohort_preview'),
+        ]
+        return urls + super().get_urls()
+
+    def preview_view(self, request):
+        #tedad daneshjoo hayi ke dar har baze zamani dastresi migiran (pish bini bar)
+        try:
+            bucket_minutes = max(1, int(request.GET.get('bucket', 15)))
+        except ValueError:
+            bucket_minutes = 15
+        buckets = SelectionCohort.projected_concurrency(bucket_minutes)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'پیش‌بینی هم‌زمانی ورود دانشجویان',
+            'buckets': buckets,
+            'bucket_minutes': bucket_minutes,
+            'peak': max((count for _, count in buckets), default=0),
+        }
+        return TemplateResponse(request, 'admin/selection_cohort_preview.html', context)
+
 @admin.register(Notice, site=super_admin_site)
-class NoticeAdmin(admin.ModelAdmin):
+class NoticeAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('title', 'text')
 
 
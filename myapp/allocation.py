@@ -0,0 +1,183 @@
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from .models import GenderChoices, User, Room, RoomAvailability
+
+
+class AllocationReport:
+    def __init__(self):
+        self.assignments = {} #user_id -> room_id
+        self.skipped = Counter() #dalil -> tedad
+        self.unknown_gender = [] #shomare daneshjoyi haye bedoon jensiat (admin bayad sabt kone)
+        self.rooms_used = set()
+        self.dry_run = False
+
+    @property
+    def placed_count(self):
+        return len(self.assignments)
+
+    def summary_lines(self):
+        lines = [f"{self.placed_count} دانشجو در {len(self.rooms_used)} اتاق جای‌گذاری شدند"]
+        for reason, count in self.skipped.most_common():
+            lines.append(f"رد شده ({reason}): {count}")
+        if self.unknown_gender:
+            codes = "، ".join(self.unknown_gender[:10]) + (" ..." if len(self.unknown_gender) > 10 else "")
+            lines.append(f"جنسیت این دانشجویان ثبت نشده است: {codes}")
+        if self.dry_run:
+            lines.append("پیش‌نمایش: هیچ تغییری ذخیره نشد")
+        return lines
+
+
+def _room_sort_key(prefer):
+    if prefer == 'expensive':
+        return lambda room: (-room['room_cost'], room['placed_in_id'], room['number'], room['pk'])
+    return lambda room: (room['room_cost'], room['placed_in_id'], room['number'], room['pk'])
+
+
+def allocate_students(students=None, groups=(), prefer='cheap', max_cost=None, block=None, dry_run=False, batch_size=1000):
+    """
+    takhsis khodkar daneshjoo haye pardakht karde va bedoon otagh be otagh haye faal dar yek transaction.
+    groups: list az list shomare daneshjoyi ha (ham otaghi ha) ke bayad ba ham dar yek otagh beran.
+    hame chiz dar hafeze anjam mishe va natije ba bulk_update / update-e Case zakhire mishe (na save tak tak).
+    """
+    report = AllocationReport()
+    report.dry_run = dry_run
+    if students is None:
+        students = User.objects.all()
+
+    #pish namayesh chizi zakhire nemikone pas satr ha ro ghofl nemikone (entekhab otagh daneshjoo ha gir nemikone)
+    rooms = Room.objects.all()
+    if not dry_run:
+        students = students.select_for_update()
+        rooms = rooms.select_for_update()
+
+    with transaction.atomic(), RoomAvailability.batch():
+        candidates = list(
+            students.filter(payed_cost=True, placed_in__isnull=True, is_staff=False)
+            .values_list('pk', 'student_code', 'gender')
+        )
+        rooms = (
+            rooms.filter(is_active=True, placed_in__is_active=True, placed_in__placed_in__is_active=True,
+                    current_occupancy__lt=F('capacity') - F('held_count'))
+            .annotate(gender=F('placed_in__placed_in__gender'))
+            .values('pk', 'number', 'room_cost', 'placed_in_id', 'gender', 'capacity', 'current_occupancy', 'held_count')
+        )
+        if max_cost is not None:
+            rooms = rooms.filter(room_cost__lte=max_cost)
+        if block is not None:
+            rooms = rooms.filter(placed_in=block)
+
+        rooms_by_gender = defaultdict(list)
+        for room in sorted(rooms, key=_room_sort_key(prefer)):
+            room['free'] = room['capacity'] - room['current_occupancy'] - room['held_count']
+            rooms_by_gender[room['gender']].append(room)
+
+        by_code = {code: (pk, gender) for pk, code, gender in candidates}
+
+        #goroh ha aval (bozorgtar ha avaltar): first-fit rooye otagh hayi ke ja baraye kol goroh daran
+        grouped = set()
+        for codes in sorted(groups, key=len, reverse=True):
+            members = [by_code[code] for code in codes if code in by_code]
+            if not members:
+                continue
+            grouped.update(pk for pk, _ in members)
+            genders = {gender for _, gender in members}
+            if '' in genders:
+                report.unknown_gender += [code for code in codes if code in by_code and not by_code[code][1]]
+            if len(genders) != 1 or not members[0][1]:
+                report.skipped['گروه هم‌اتاقی با جنسیت متفاوت یا نامشخص'] += len(members)
+                continue
+            room = next((r for r in rooms_by_gender[members[0][1]] if r['free'] >= len(members)), None)
+            if room is None:
+                report.skipped['اتاقی با جای کافی برای گروه هم‌اتاقی نیست'] += len(members)
+                continue
+            for pk, _ in members:
+                report.assignments[pk] = room['pk']
+            room['free'] -= len(members)
+            report.rooms_used.add(room['pk'])
+
+        #baghie: har otagh ro por mikonim bad mirim soraghe baadi
+        cursors = defaultdict(int)
+        for pk, code, gender in candidates:
+            if pk in grouped:
+                continue
+            if not gender:
+                report.skipped['جنسیت نامشخص'] += 1
+                report.unknown_gender.append(code)
+                continue
+            gender_rooms = rooms_by_gender[gender]
+            i = cursors[gender]
+            while i < len(gender_rooms) and gender_rooms[i]['free'] <= 0:
+                i += 1
+            cursors[gender] = i
+            if i == len(gender_rooms):
+                report.skipped[f'اتاق خالی برای {GenderChoices(gender).label} نیست'] += 1
+                continue
+            room = gender_rooms[i]
+            report.assignments[pk] = room['pk']
+            room['free'] -= 1
+            report.rooms_used.add(room['pk'])
+
+        if not dry_run and report.assignments:
+            _save_assignments(report.assignments, batch_size)
+
+    return report
+
+
+def _save_assignments(assignments, batch_size):
+    #daneshjoo ha bar asas otagh goroh mishan: har UPDATE ye Case ba yek When be ezaye har otagh
+    # (bulk_update be ezaye har satr ye When misaze ke baraye hezaran satr kond ast)
+    users_by_room = defaultdict(list)
+    for user_id, room_id in assignments.items():
+        users_by_room[room_id].append(user_id)
+
+    room_ids = list(users_by_room)
+    rooms_per_query = max(1, batch_size // 5)
+    for start in range(0, len(room_ids), rooms_per_query):
+        chunk = room_ids[start:start + rooms_per_query]
+        user_ids = [user_id for room_id in chunk for user_id in users_by_room[room_id]]
+        User.objects.filter(pk__in=user_ids).update(
+            placed_in=Case(*[When(pk__in=users_by_room[room_id], then=Value(room_id)) for room_id in chunk])
+        )
+
+        #otagh ha bar asas tedad ezafe shode goroh mishan
+        rooms_by_count = defaultdict(list)
+        for room_id in chunk:
+            rooms_by_count[len(users_by_room[room_id])].append(room_id)
+        Room.objects.filter(pk__in=chunk).update(
+            current_occupancy=F('current_occupancy') + Case(
+                *[When(pk__in=ids, then=Value(count)) for count, ids in rooms_by_count.items()],
+                default=Value(0),
+            )
+        )
+        RoomAvailability.apply(occupancy={room_id: len(users_by_room[room_id]) for room_id in chunk})
+
+
+def release_students(students, batch_size=1000):
+    """
+    daneshjoo haye entekhab shode az otagh kharej mishan (mesl move_to_room(None) vali dasteyi):
+    har dasteh yek UPDATE baraye user ha va yek UPDATE-e Case baraye shomarande otagh ha.
+    id otagh haye taghir karde ro barmigardune.
+    """
+    with transaction.atomic(), RoomAvailability.batch():
+        placed = list(
+            students.select_for_update().filter(placed_in__isnull=False).values_list('pk', 'placed_in_id')
+        )
+        #hame otagh ha aval (be tartib pk), counter version akhar (Room.lock)
+        Room.lock({room_id for _, room_id in placed})
+        for start in range(0, len(placed), batch_size):
+            chunk = placed[start:start + batch_size]
+            User.objects.filter(pk__in=[user_id for user_id, _ in chunk]).update(placed_in=None)
+
+            counts = Counter(room_id for _, room_id in chunk)
+            rooms_by_count = defaultdict(list)
+            for room_id, count in counts.items():
+                rooms_by_count[count].append(room_id)
+            Room.objects.filter(pk__in=counts).update(
+                current_occupancy=F('current_occupancy') - Case(
+                    *[When(pk__in=ids, then=Value(count)) for count, ids in rooms_by_count.items()],
+                    default=Value(0),
+                )
+            )
+            RoomAvailability.apply(occupancy={room_id: -count for room_id, count in counts.items()})
+    return {room_id for _, room_id in placed}
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
-    verbose_name = 'سامانه خوابگاه تحت وب'
\ No newline at end of file
+    verbose_name = 'سامانه خوابگاه تحت وب'
+
+    def ready(self):
+        from . import signals, metrics  # noqa: F401
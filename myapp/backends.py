@@ -0,0 +1,61 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from .models import User
+from .hashing import run_hash
+
+
+def _save_upgraded_password(user, old_password, new_password):
+    #mesl setter khode Django vali sharti: agar hamzaman ramz avaz shode bashe hash ghadimi ro bar nemigardune
+    User.objects.filter(pk=user.pk, password=old_password).update(password=new_password)
+    user.password = new_password #session auth hash az hash jadid sakhte mishe
+
+
+class StudentCodeBackend(ModelBackend):
+    """
+    login ba shomare daneshjoyi dar yek query (student_code unique/index dare).
+    is_active inja check nemishe ta index_page payam "حساب غیرفعال" ro neshun bede;
+    get_user (az ModelBackend) karbar gheyr faal ro dar request haye baadi rad mikone.
+    """
+
+    def authenticate(self, request, student_code=None, password=None):
+        if student_code is None or password is None:
+            return None
+        try:
+            user = User.objects.get(student_code=student_code)
+        except User.DoesNotExist:
+            #hash ro hatman ejra mikonim ta zaman pasokh vojood/adam vojood daneshjoo ro lo nade
+            make_password(password)
+            return None
+
+        old_password = user.password
+
+        def upgrade(raw_password):
+            _save_upgraded_password(user, old_password, make_password(raw_password))
+
+        if check_password(password, old_password, setter=upgrade):
+            return user
+        return None
+
+    async def aauthenticate(self, request, student_code=None, password=None):
+        #noskhe async: query ba ORM async, hash dar pool mahdood (momkene HashingBusy bede)
+        if student_code is None or password is None:
+            return None
+        try:
+            user = await User.objects.aget(student_code=student_code)
+        except User.DoesNotExist:
+            await run_hash(make_password, password)
+            return None
+
+        #hash jadid dar thread pool sakhte mishe; UPDATE dar hamin request (na dar thread pool)
+        old_password = user.password
+        upgraded = []
+
+        def upgrade(raw_password):
+            upgraded.append(make_password(raw_password))
+
+        if not await run_hash(check_password, password, old_password, upgrade):
+            return None
+        if upgraded:
+            await User.objects.filter(pk=user.pk, password=old_password).aupdate(password=upgraded[0])
+            user.password = upgraded[0]
+        return user
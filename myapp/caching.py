@@ -0,0 +1,28 @@
+import time
+from django.core.cache import cache
+from .routing import primary
+
+# cache do sathe: hafeze khode process (TTL kootah) + cache moshtarak beyn worker ha.
+# pak kardan ba clear_cached faghat process feli ro pak mikone; worker haye dige ba LOCAL_TIMEOUT be rooz mishan.
+LOCAL_TIMEOUT = 5
+_local_copies = {} #key -> (expires_at, value)
+
+
+def get_cached(key, loader, timeout=60, local_timeout=LOCAL_TIMEOUT):
+    now = time.monotonic()
+    local_copy = _local_copies.get(key)
+    if local_copy is not None and local_copy[0] > now:
+        return local_copy[1]
+
+    value = cache.get(key)
+    if value is None:
+        with primary():
+            value = loader()
+        cache.set(key, value, timeout)
+    _local_copies[key] = (now + local_timeout, value)
+    return value
+
+
+def clear_cached(key):
+    _local_copies.pop(key, None)
+    cache.delete(key)
@@ -0,0 +1,50 @@
+import logging
+import threading
+import time
+from django.db import DatabaseError
+from django.db.models import Case, DateTimeField, Value, When
+
+logger = logging.getLogger(__name__)
+
+# last_login (kam ahamiat) dar hafeze jam mishe va dar yek UPDATE gorohi zakhire mishe, na yek write be ezaye
+# har login. flush: ba residan be FLUSH_SIZE, ya dar payan har request agar FLUSH_INTERVAL gozashte bashe.
+# (upgrade hash ramz inja nist: ba session auth hash gere khorde va hamoon moghe login zakhire mishe)
+FLUSH_SIZE = 200
+FLUSH_INTERVAL = 5 #sanie
+
+_lock = threading.Lock()
+_last_logins = {} #user_id -> datetime
+_last_flush = time.monotonic()
+
+
+def defer_last_login(user_id, when):
+    with _lock:
+        _last_logins[user_id] = when
+        full = len(_last_logins) >= FLUSH_SIZE
+    if full:
+        flush()
+
+
+def flush_if_due(**kwargs):
+    #receiver request_finished: bedoon login jadid ham ba gozasht zaman zakhire mishe
+    if _last_logins and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    global _last_logins, _last_flush
+    from .models import User
+
+    with _lock:
+        last_logins, _last_logins = _last_logins, {}
+        _last_flush = time.monotonic()
+    if not last_logins:
+        return
+
+    try:
+        User.objects.filter(pk__in=last_logins).update(last_login=Case(
+            *[When(pk=pk, then=Value(value)) for pk, value in last_logins.items()], output_field=DateTimeField(),
+        ))
+    except DatabaseError:
+        #az dast raftan last_login moshkeli nist
+        logger.exception("deferred last_login writes could not be flushed")
@@ -0,0 +1,52 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .spreadsheets import iter_csv, iter_xlsx
+
+# export jaryani (streaming) baraye list haye bozorg: har chunk ye query join shode rooye pk (keyset),
+# pas hafeze sabet mimune va bytes aval ghabl az query aval ersal mishe.
+# (iterator() rooye MySQL kol natije ro dar client negah midare; keyset rooye hame backend ha sabet ast)
+
+EXPORT_CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (iter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def iter_export_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+async def _aiter(chunks):
+    #ASGI: iterator sync ro Django kamel dar hafeze jam mikone; inja tekke be tekke dar thread sync
+    iterator = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(iterator, None)) is not None:
+        yield chunk
+
+
+def export_response(request, queryset, columns, filename, file_format):
+    """columns: [(field ba __, onvan sotoon), ...]"""
+    writer, content_type = FORMATS[file_format]
+    header = [title for _, title in columns]
+    chunks = writer(header, iter_export_rows(queryset, [field for field, _ in columns]))
+    response = StreamingHttpResponse(
+        _aiter(chunks) if isinstance(request, ASGIRequest) else chunks,
+        content_type=content_type,
+    )
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{stamp}.{file_format}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,5 +1,5 @@
 from django import forms
-from .models import User
+from .models import User, GenderChoices
 from django.core.validators import EmailValidator
 from django.core.exceptions import ValidationError
 
@@ -39,6 +39,12 @@ class SignUpForm(forms.Form):
     )
     first_name = forms.CharField(max_length=20, label="نام")
     last_name = forms.CharField(max_length=20, label="نام خانوادگی")
+    #goroh haye zamani jensiat va takhsis khodkar be in niaz daran
+    gender = forms.ChoiceField(
+        choices=GenderChoices.choices,
+        label="نوع خوابگاه",
+        error_messages={'required': "نوع خوابگاه را انتخاب کنید.", 'invalid_choice': "نوع خوابگاه انتخاب شده معتبر نیست."},
+    )
     password = forms.CharField(
         min_length=6, 
         label="رمز عبور",
@@ -100,13 +106,18 @@ class ChangePasswordForm(forms.Form):
         label="تکرار رمز عبور جدید"
     )
 
-    def __init__(self, user, *args, **kwargs):
+    def __init__(self, user, *args, old_password_valid=None, **kwargs):
         self.user = user #add user field to form for validation
+        #view async natije check ramz feli ro az pool hash mide (None: inja check mishe)
+        self.old_password_valid = old_password_valid
         super().__init__(*args, **kwargs)
 
     def clean_old_password(self):
         old_password = self.cleaned_data.get('old_password')
-        if not self.user.check_password(old_password):
+        valid = self.old_password_valid
+        if valid is None:
+            valid = self.user.check_password(old_password)
+        if not valid:
             raise ValidationError("رمز عبور فعلی اشتباه است.")
         return old_password
 
@@ -157,4 +168,11 @@ class UserProfileForm(forms.Form):
         # if email_data: #agar ino bezarim email karvar pak nemishe dige
         user.email = email_data
             
-        user.save()
\ No newline at end of file
+        user.save(update_fields=['first_name', 'last_name', 'email'])
+
+class PaymentReconciliationForm(forms.Form):
+    file = forms.FileField(
+        label="فایل واحد پرداخت (CSV / XLSX)",
+        help_text="ستون ها: student_code و/یا national_code و اختیاری paid (خالی یا 1 = پرداخت شده، 0 = پرداخت نشده)",
+    )
+    dry_run = forms.BooleanField(label="فقط پیش‌نمایش (بدون ذخیره)", required=False, initial=True)
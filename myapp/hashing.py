@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .metrics import Histogram
+
+# hash ramz (login / signup / taghir ramz) dar yek pool mahdood ejra mishe ta dar shoologhi
+# zaman entekhab otagh hame worker ha ro ashghal nakone. vaghti saf por ast HashingBusy
+# raise mishe va view fori javab "dobare talash konid" mide.
+# hashlib.pbkdf2_hmac GIL ro azad mikone pas thread baraye in kar kafi ast.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float('inf'))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, workers, queue_limit):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.queue_limit = queue_limit
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected_total = 0
+        self.completed_total = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected_total += 1
+                raise HashingBusy
+            self.in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_flight -= 1
+                self.completed_total += 1
+                self.latency.observe(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'queue_depth': self.in_flight,
+                'queue_limit': self.queue_limit,
+                'rejected_total': self.rejected_total,
+                'completed_total': self.completed_total,
+                'latency_seconds_sum': self.latency.sum,
+                'latency_seconds_buckets': dict(self.latency.cumulative()),
+            }
+
+
+pool = HashingPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_LIMIT)
+
+
+async def run_hash(func, *args):
+    return await pool.run(func, *args)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# pakhsh zende taghir zarfiat otagh ha (SSE) be safhe entekhab otagh.
+# har subscriber faghat akharin vaziat har otagh ro negah midare (coalesce): masraf konande kond
+# saf bi entaha nemisaze, dafe baad faghat akharin vaziat otagh haye avaz shode ro migire.
+# subscriber bikar faghat rooye yek asyncio.Event montazer ast (bedoon CPU).
+
+
+def scope_matches(scope, room):
+    dorm_id, block_id, floor = scope
+    return (
+        (dorm_id is None or dorm_id == room['dorm'])
+        and (block_id is None or block_id == room['block'])
+        and (floor is None or floor == room['floor'])
+    )
+
+
+class Subscription:
+    def __init__(self, scope, loop):
+        self.scope = scope #(dorm_id, block_id, floor) mesl listing_scope
+        self.loop = loop
+        self.pending = {} #room_id -> akharin vaziat
+        self.ready = asyncio.Event()
+
+    def push(self, rooms):
+        #faghat dar thread event loop khodesh seda zade mishe
+        for room in rooms:
+            self.pending[room['id']] = room
+        self.ready.set()
+
+    async def wait(self, timeout):
+        #list otagh haye avaz shode ya [] baad az timeout (baraye heartbeat)
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        rooms, self.pending = list(self.pending.values()), {}
+        return rooms
+
+
+class LocalHub:
+    """hub dakhel process: faghat subscriber haye hamin worker ro khabar mikone."""
+
+    def __init__(self, location=None):
+        self._lock = threading.Lock()
+        self._by_scope = {} #scope -> set(Subscription)
+
+    def subscribe(self, scope):
+        subscription = Subscription(scope, asyncio.get_running_loop())
+        with self._lock:
+            self._by_scope.setdefault(scope, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._by_scope.get(subscription.scope)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._by_scope[subscription.scope]
+
+    def publish(self, rooms):
+        self.deliver(rooms)
+
+    def deliver(self, rooms):
+        #check be ezaye har scope (na har subscriber); har event loop yek call_soon_threadsafe
+        with self._lock:
+            scopes = list(self._by_scope.items())
+        by_loop = {}
+        for scope, subscriptions in scopes:
+            matching = [room for room in rooms if scope_matches(scope, room)]
+            if matching:
+                for subscription in subscriptions:
+                    by_loop.setdefault(subscription.loop, []).append((subscription, matching))
+        for loop, targets in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_push_all, targets)
+            except RuntimeError:
+                pass #loop baste shode
+
+
+def _push_all(targets):
+    for subscription, rooms in targets:
+        subscription.push(rooms)
+
+
+class RedisHub(LocalHub):
+    """hub moshtarak beyn chand worker ba Redis pub/sub (LIVE_HUB_LOCATION = redis://...)."""
+
+    CHANNEL = 'webdorm:availability'
+
+    def __init__(self, location=None):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("برای RedisHub بسته redis باید نصب باشد.")
+        self._client = redis.Redis.from_url(location or 'redis://localhost:6379/0')
+        self._listener = None
+
+    def subscribe(self, scope):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='live-hub', daemon=True)
+                    self._listener.start()
+        return super().subscribe(scope)
+
+    def publish(self, rooms):
+        self._client.publish(self.CHANNEL, json.dumps(rooms))
+
+    def _listen(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.CHANNEL)
+        for message in pubsub.listen():
+            self.deliver(json.loads(message['data']))
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = import_string(settings.LIVE_HUB_BACKEND)(settings.LIVE_HUB_LOCATION or None)
+    return _hub
+
+
+def publish_rooms(room_ids):
+    #vaziat jadid otagh ha baad az commit (ta subscriber ha dade commit nashode nabinan)
+    from .models import RoomAvailability
+
+    def send():
+        rooms = [
+            {
+                'id': pk, 'dorm': dorm_id, 'block': block_id, 'floor': floor, 'occupancy': occupancy,
+                'capacity': capacity, 'free_slots': free_slots, 'listed': listed,
+            }
+            for pk, dorm_id, block_id, floor, occupancy, capacity, free_slots, listed in
+            RoomAvailability.objects.filter(pk__in=room_ids).values_list(
+                'pk', 'dorm_id', 'block_id', 'floor_number', 'occupancy', 'capacity', 'free_slots', 'is_listed',
+            )
+        ]
+        if rooms:
+            get_hub().publish(rooms)
+
+    transaction.on_commit(send)
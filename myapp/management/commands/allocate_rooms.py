@@ -0,0 +1,38 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from myapp.allocation import allocate_students
+from myapp.forms import fix_numbers
+
+
+class Command(BaseCommand):
+    help = "تخصیص خودکار اتاق به همه دانشجویان پرداخت‌کرده و بدون اتاق"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="فقط گزارش، بدون ذخیره")
+        parser.add_argument('--prefer', choices=['cheap', 'expensive'], default='cheap', help="ترتیب پر کردن اتاق ها بر اساس هزینه")
+        parser.add_argument('--max-cost', type=int, default=None, help="فقط اتاق های با هزینه کمتر یا مساوی")
+        parser.add_argument('--groups', default=None, help="فایل CSV هم‌اتاقی ها: هر سطر شماره دانشجویی های یک گروه")
+
+    def handle(self, *args, **options):
+        groups = []
+        if options['groups']:
+            try:
+                with open(options['groups'], newline='', encoding='utf-8-sig') as f:
+                    for row in csv.reader(f):
+                        codes = [fix_numbers(cell) for cell in row if cell.strip()]
+                        if codes:
+                            groups.append(codes)
+            except OSError as exc:
+                raise CommandError(f"cannot read groups file: {exc}")
+
+        started = time.perf_counter()
+        report = allocate_students(
+            groups=groups,
+            prefer=options['prefer'],
+            max_cost=options['max_cost'],
+            dry_run=options['dry_run'],
+        )
+        for line in report.summary_lines():
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"done in {time.perf_counter() - started:.2f}s"))
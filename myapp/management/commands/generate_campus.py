@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from myapp.models import User, Dorm, Block, OtherInfo, GenderChoices
+
+
+class Command(BaseCommand):
+    help = (
+        "ساخت خوابگاه، بلوک، اتاق و دانشجوی آزمایشی (پرداخت کرده) برای تست بار. "
+        "شماره دانشجویی ها با --code-prefix شروع می شوند و رمز همه --password است."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dorms', type=int, default=4)
+        parser.add_argument('--blocks', type=int, default=5, help="تعداد بلوک در هر خوابگاه")
+        parser.add_argument('--floors', type=int, default=5)
+        parser.add_argument('--rooms-per-floor', type=int, default=10)
+        parser.add_argument('--capacity', type=int, default=6)
+        parser.add_argument('--students', type=int, default=20000)
+        parser.add_argument('--code-prefix', default='9', help="پیشوند شماره دانشجویی (۹ رقم کامل می شود)")
+        parser.add_argument('--password', default='loadtest123')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--open-window', type=int, default=0, metavar='HOURS',
+                            help="باز کردن زمان انتخاب اتاق از الان تا HOURS ساعت بعد")
+
+    def handle(self, *args, **options):
+        prefix = options['code_prefix']
+        digits = 9 - len(prefix)
+        if not prefix.isdigit() or digits < len(str(options['students'])):
+            raise CommandError("code prefix must be digits and leave room for the student count in 9 digits")
+        if User.objects.filter(student_code__startswith=prefix).exists():
+            raise CommandError(f"students with code prefix {prefix} already exist; use another --code-prefix")
+
+        started = time.perf_counter()
+        genders = [GenderChoices.male, GenderChoices.female]
+        with transaction.atomic():
+            for d in range(options['dorms']):
+                dorm = Dorm.objects.create(name=f"load {prefix}-{d + 1}", gender=genders[d % 2])
+                for b in range(options['blocks']):
+                    #otagh ha ba hamoon Block.save -> create_rooms_automatically sakhte mishan
+                    Block.objects.create(
+                        name=f"{b + 1}", placed_in=dorm, floor_count=options['floors'],
+                        floor_rooms=options['rooms_per_floor'], default_room_capacity=options['capacity'],
+                        room_costs=1_000_000 + 250_000 * (b % 4),
+                    )
+        self.stdout.write(f"campus built in {time.perf_counter() - started:.1f}s")
+
+        #hash ramz faghat yek bar (hame daneshjoo haye azmayeshi ye ramz daran)
+        password = make_password(options['password'])
+        created = 0
+        for start in range(0, options['students'], options['batch_size']):
+            end = min(start + options['batch_size'], options['students'])
+            User.objects.bulk_create(
+                User(
+                    username=f"{prefix}{i:0{digits}d}", student_code=f"{prefix}{i:0{digits}d}",
+                    national_code=f"{prefix}{i:0{digits}d}0", first_name="load", last_name=f"test {i}",
+                    password=password, payed_cost=True, gender=genders[i % 2],
+                )
+                for i in range(start, end)
+            )
+            created = end
+        self.stdout.write(f"{created} student(s) created")
+
+        if options['open_window']:
+            OtherInfo.objects.update_or_create(pk=1, defaults={
+                'start_selectroom_event': timezone.now(),
+                'end_selectroom_event': timezone.now() + timedelta(hours=options['open_window']),
+            })
+            self.stdout.write("room selection window is open")
+
+        self.stdout.write(self.style.SUCCESS(f"done in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,129 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from myapp.forms import fix_numbers
+from myapp.models import User, GenderChoices
+from myapp.spreadsheets import iter_rows
+
+
+def _init_worker(settings_module):
+    #worker haye spawn shode (windows / macOS) settings django ro nadaran
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def _chunks(items, size):
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "ورود گروهی دانشجویان از فایل CSV/XLSX. ستون ها: student_code, national_code, first_name, last_name "
+        "و اختیاری email, gender, password (پیش فرض رمز: کد ملی)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="تعداد پردازه های هش کردن رمز")
+        parser.add_argument('--paid', action='store_true', help="علامت زدن همه به عنوان پرداخت کرده")
+        parser.add_argument('--dry-run', action='store_true', help="فقط بررسی فایل، بدون ذخیره")
+
+    def handle(self, *args, **options):
+        self.existing_student_codes = set(User.objects.values_list('student_code', flat=True))
+        self.existing_national_codes = set(User.objects.values_list('national_code', flat=True))
+        #username = shomare daneshjoyi; karbar haye dasti (admin) mitunan hamin username ro dashte bashan
+        self.existing_usernames = set(User.objects.values_list('username', flat=True))
+        self.errors = 0
+        created = 0
+        started = time.perf_counter()
+
+        try:
+            rows = iter_rows(options['path'])
+            batches = _chunks(self.valid_rows(rows), options['batch_size'])
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'webdorm.settings'),),
+            ) as pool:
+                for batch in batches:
+                    created += self.insert_batch(batch, pool, options)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"{created} created, {self.errors} error(s), {created / elapsed:.0f} rows/s")
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        elapsed = time.perf_counter() - started
+        message = f"{created} student(s) {'validated' if options['dry_run'] else 'created'}, {self.errors} error(s) in {elapsed:.1f}s"
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def row_error(self, line_number, message):
+        self.errors += 1
+        self.stderr.write(f"row {line_number}: {message}")
+
+    def valid_rows(self, rows):
+        #hamoon ghavanin SignUpForm; yekta boodan ba set haye az pish load shode (na query be ezaye har satr)
+        genders = set(GenderChoices.values)
+        for line_number, row in rows:
+            student_code = fix_numbers(row.get('student_code', ''))
+            national_code = fix_numbers(row.get('national_code', ''))
+            first_name = row.get('first_name', '')
+            last_name = row.get('last_name', '')
+            gender = row.get('gender', '').lower()
+
+            if not student_code.isdigit() or len(student_code) != 9:
+                self.row_error(line_number, f"invalid student_code {student_code!r}")
+            elif not national_code.isdigit() or len(national_code) != 10:
+                self.row_error(line_number, f"invalid national_code {national_code!r}")
+            elif not first_name or not last_name or len(first_name) > 20 or len(last_name) > 20:
+                self.row_error(line_number, "first_name / last_name missing or longer than 20 characters")
+            elif gender and gender not in genders:
+                self.row_error(line_number, f"invalid gender {gender!r}")
+            elif student_code in self.existing_student_codes:
+                self.row_error(line_number, f"duplicate student_code {student_code}")
+            elif national_code in self.existing_national_codes:
+                self.row_error(line_number, f"duplicate national_code {national_code}")
+            elif student_code in self.existing_usernames:
+                self.row_error(line_number, f"username {student_code} is already taken")
+            else:
+                self.existing_student_codes.add(student_code)
+                self.existing_national_codes.add(national_code)
+                self.existing_usernames.add(student_code)
+                yield {
+                    'student_code': student_code,
+                    'national_code': national_code,
+                    'first_name': first_name,
+                    'last_name': last_name,
+                    'email': row.get('email', ''),
+                    'gender': gender,
+                    'password': row.get('password') or national_code,
+                }
+
+    def insert_batch(self, batch, pool, options):
+        if options['dry_run']:
+            return len(batch)
+
+        #hash kardan (kar sangin CPU) beyn chand process pakhsh mishe
+        workers = max(1, options['workers'])
+        chunk_size = max(1, len(batch) // (workers * 4))
+        passwords = [row.pop('password') for row in batch]
+        hashed = [h for chunk in pool.map(_hash_passwords, _chunks(passwords, chunk_size)) for h in chunk]
+
+        users = [
+            User(username=row['student_code'], password=password, payed_cost=options['paid'], **row)
+            for row, password in zip(batch, hashed)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=options['batch_size'])
+        return len(users)
@@ -0,0 +1,12 @@
+import time
+from django.core.management.base import BaseCommand
+from myapp.models import RoomAvailability
+
+
+class Command(BaseCommand):
+    help = "بازسازی کامل جدول ظرفیت خالی اتاق ها (RoomAvailability) از روی اتاق ها، بلوک ها و خوابگاه ها"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = RoomAvailability.refresh()
+        self.stdout.write(self.style.SUCCESS(f"{count} room(s) rebuilt in {time.perf_counter() - started:.1f}s"))
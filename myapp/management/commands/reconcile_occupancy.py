@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from myapp.models import User, Room, RoomAvailability, RoomHold
+
+
+def count_per_room(queryset, room_field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{room_field: OuterRef('pk')})
+            .order_by()
+            .values(room_field)
+            .annotate(c=Count('pk'))
+            .values('c'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = "بازسازی تعداد ساکنین و رزروهای موقت هر اتاق (current_occupancy / held_count) از روی User.placed_in و RoomHold"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="فقط گزارش اختلاف ها، بدون ذخیره")
+
+    def handle(self, *args, **options):
+        real_count = count_per_room(User.objects.all(), 'placed_in')
+        real_held = count_per_room(RoomHold.objects.all(), 'room')
+
+        with transaction.atomic():
+            mismatched = (
+                Room.objects.select_for_update()
+                .annotate(real_count=real_count, real_held=real_held)
+                .filter(~Q(current_occupancy=real_count) | ~Q(held_count=real_held))
+                .values_list('pk', 'current_occupancy', 'real_count', 'held_count', 'real_held')
+            )
+            mismatched = list(mismatched)
+            for pk, stored, real, stored_held, held in mismatched:
+                self.stdout.write(f"room {pk}: occupancy {stored} -> {real}, held {stored_held} -> {held}")
+
+            if not options['dry_run'] and mismatched:
+                #yek UPDATE baraye hame otagh ha
+                Room.objects.update(current_occupancy=real_count, held_count=real_held)
+                RoomAvailability.refresh(Room.objects.filter(pk__in=[row[0] for row in mismatched]))
+
+        self.stdout.write(self.style.SUCCESS(f"{len(mismatched)} room(s) out of sync"))
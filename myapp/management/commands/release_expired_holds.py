@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from myapp.models import RoomHold
+
+
+class Command(BaseCommand):
+    help = "آزاد کردن رزروهای موقت منقضی شده (برای اجرای دوره‌ای، مثلا هر دقیقه با cron)"
+
+    def handle(self, *args, **options):
+        released = RoomHold.release_expired()
+        self.stdout.write(self.style.SUCCESS(f"{released} expired hold(s) released"))
@@ -0,0 +1,231 @@
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Count, F, Q
+from django.test import Client
+from django.urls import get_script_prefix, reverse
+from myapp.models import User, Room
+
+# shabih sazi shoologhi zaman entekhab otagh: har client yek daneshjoo ast ke
+# login -> select_room_page -> view_room -> book_room ro anjam mide (dar hamin process ya rooye server local).
+
+ROOM_CARD = re.compile(r'data-room="(\d+)".*?<button class="select-btn-sm" data-select ([^>]*)>', re.S)
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+LISTING_FILTERS = ('', 'capacity_sort=empty', 'price_sort=cheap', 'price_sort=expensive', 'capacity_sort=empty&floor=1')
+
+
+def path_for(name, *args):
+    #bedoon FORCE_SCRIPT_NAME (/webdorm): client test va runserver local rooye / hastan
+    return '/' + reverse(name, args=args)[len(get_script_prefix()):]
+
+
+class InProcessSession:
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            response = self.client.post(path, data, secure=True)
+        else:
+            response = self.client.get(path, secure=True)
+        body = b'' if response.streaming else response.content
+        return response.status_code, body.decode(errors='replace')
+
+    def close(self):
+        connection.close() #har thread connection khodesh ro dare
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    #har view joda andaze gerefte mishe; redirect ha donbal nemishan
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        body = None
+        headers = {'Referer': url}
+        if method == 'POST':
+            body = urllib.parse.urlencode(data).encode()
+        try:
+            with self.opener.open(urllib.request.Request(url, data=body, headers=headers, method=method), timeout=60) as response:
+                return response.status, response.read().decode(errors='replace')
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read().decode(errors='replace')
+
+    def close(self):
+        pass
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list) #view -> [seconds]
+        self.statuses = defaultdict(lambda: defaultdict(int)) #view -> status -> tedad
+        self.outcomes = defaultdict(int)
+        self.errors = defaultdict(int) #khata haye DB / server, joda az "otagh por shod" ke tabiee ast
+
+    def timed(self, session, view, method, path, data=None):
+        started = time.perf_counter()
+        status, body = session.request(method, path, data)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[view].append(elapsed)
+            self.statuses[view][status] += 1
+        return status, body
+
+    def outcome(self, name):
+        with self._lock:
+            self.outcomes[name] += 1
+
+    def error(self, name):
+        with self._lock:
+            self.errors[name] += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "تست بار زمان انتخاب اتاق: ورود، لیست اتاق ها، مشاهده و رزرو اتاق با چند کلاینت همزمان "
+        "(داخل همین پردازه یا روی سرور محلی با --base-url). دانشجوها از generate_campus می آیند."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20, help="تعداد کلاینت همزمان")
+        parser.add_argument('--students', type=int, default=500, help="تعداد کل دانشجوهایی که رزرو می کنند")
+        parser.add_argument('--code-prefix', default='9')
+        parser.add_argument('--password', default='loadtest123')
+        parser.add_argument('--base-url', default='', help="مثلا http://127.0.0.1:8000 ؛ خالی = داخل همین پردازه")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        codes = list(
+            User.objects.filter(student_code__startswith=options['code_prefix'], placed_in__isnull=True, payed_cost=True)
+            .order_by('?' if options['seed'] is None else 'pk')
+            .values_list('student_code', flat=True)[:options['students']]
+        )
+        if not codes:
+            raise CommandError("no unplaced students with that code prefix; run generate_campus first")
+
+        self.paths = {
+            'index_': path_for('index_'),
+            'select_room_': path_for('select_room_'),
+            'view_room_': path_for('view_room_', 0)[:-2], #+ "<pk>/"
+            'book_room_action': path_for('book_room_action', 0)[:-2],
+        }
+        base_url = options['base_url']
+        self.new_session = (lambda: HttpSession(base_url)) if base_url else InProcessSession
+        clients = options['clients']
+        if not base_url and connection.vendor == 'sqlite' and clients > 1:
+            #SQLite har write ro ba ghofl kol DB serial mikone; client haye hamzaman faghat "database is locked" mibinan
+            self.stderr.write("SQLite allows one writer at a time: running in-process clients one by one (use MySQL for concurrency)")
+            clients = 1
+        self.password = options['password']
+        recorder = Recorder()
+        seeds = [rng.random() for _ in codes]
+
+        self.stdout.write(f"{len(codes)} student(s), {clients} client(s), {'http ' + base_url if base_url else 'in-process'}")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            for _ in pool.map(lambda args: self.run_student(recorder, *args), zip(codes, seeds)):
+                pass
+        elapsed = time.perf_counter() - started
+
+        self.report(recorder, elapsed)
+        self.check_capacity()
+
+    def run_student(self, recorder, student_code, seed):
+        rng = random.Random(seed)
+        session = self.new_session()
+        try:
+            status, body = recorder.timed(session, 'index_ (GET)', 'GET', self.paths['index_'])
+            csrf = CSRF_INPUT.search(body)
+            data = {'student_id': student_code, 'password': self.password}
+            if csrf:
+                data['csrfmiddlewaretoken'] = csrf.group(1)
+            status, _ = recorder.timed(session, 'index_ (POST)', 'POST', self.paths['index_'], data)
+            if status >= 500:
+                recorder.error(f'server error ({status})')
+                return
+            if status != 302:
+                recorder.outcome(f'login failed ({status})')
+                return
+
+            #ta 3 bar: list -> yek otagh khali -> rezerv; agar por shod dobare list
+            for _ in range(3):
+                query = rng.choice(LISTING_FILTERS)
+                path = self.paths['select_room_'] + (f'?{query}' if query else '')
+                status, body = recorder.timed(session, 'select_room_', 'GET', path)
+                free_rooms = [pk for pk, attrs in ROOM_CARD.findall(body) if 'disabled' not in attrs]
+                if not free_rooms:
+                    recorder.outcome('no free room on page')
+                    continue
+                room_id = rng.choice(free_rooms)
+                recorder.timed(session, 'view_room_', 'GET', f"{self.paths['view_room_']}{room_id}/")
+                status, _ = recorder.timed(session, 'book_room_action', 'GET', f"{self.paths['book_room_action']}{room_id}/")
+                if status >= 500:
+                    recorder.error(f'server error ({status})')
+                    return
+                if status == 302 and User.objects.filter(student_code=student_code, placed_in_id=room_id).exists():
+                    recorder.outcome('booked')
+                    return
+                recorder.outcome('room filled, retry')
+            recorder.outcome('gave up')
+        except DatabaseError as exc:
+            recorder.error(f'database: {type(exc).__name__}: {exc}')
+        except Exception as exc:
+            #yek daneshjoo kharab shod; baghie edame midan
+            recorder.error(f'{type(exc).__name__}: {exc}')
+        finally:
+            session.close()
+
+    def report(self, recorder, elapsed):
+        total = sum(len(values) for values in recorder.latencies.values())
+        self.stdout.write(f"\n{total} request(s) in {elapsed:.1f}s: {total / elapsed:.1f} req/s")
+        self.stdout.write(f"{'view':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses")
+        for view, values in recorder.latencies.items():
+            statuses = ' '.join(f"{status}:{count}" for status, count in sorted(recorder.statuses[view].items()))
+            self.stdout.write(
+                f"{view:<20}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}"
+                f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}  {statuses}"
+            )
+        self.stdout.write("")
+        for outcome, count in sorted(recorder.outcomes.items()):
+            self.stdout.write(f"{outcome}: {count}")
+        if recorder.errors:
+            self.stderr.write(f"\n{sum(recorder.errors.values())} student(s) stopped by errors (not capacity):")
+            for error, count in sorted(recorder.errors.items(), key=lambda item: -item[1]):
+                self.stderr.write(f"  {count} x {error}")
+
+    def check_capacity(self):
+        #ham shomarande ha ham tedad vagheyi daneshjoo haye har otagh
+        over = list(
+            Room.objects.annotate(real=Count('students'))
+            .filter(Q(real__gt=F('capacity')) | Q(current_occupancy__gt=F('capacity')) | ~Q(current_occupancy=F('real')))
+            .values_list('pk', 'capacity', 'current_occupancy', 'real')
+        )
+        if over:
+            for pk, capacity, stored, real in over:
+                self.stderr.write(f"room {pk}: capacity {capacity}, counter {stored}, students {real}")
+            raise CommandError(f"{len(over)} room(s) over capacity or out of sync")
+        self.stdout.write(self.style.SUCCESS("capacity check passed: no room over capacity"))
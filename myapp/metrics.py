@@ -0,0 +1,245 @@
+import logging
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+# andaze giri har request (latency, tedad / zaman query, zaman render template, hajm javab) be ezaye esm url.
+# hame chiz dar hafeze khode process jam mishe va dar /metrics ba format Prometheus neshoon dade mishe.
+
+slow_query_logger = logging.getLogger('webdorm.slow_queries')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, float('inf'))
+SIZE_BUCKETS = (1_000, 5_000, 20_000, 100_000, 500_000, 2_000_000, float('inf'))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets) #gheyre tajamoi; dar khorooji tajamoi mishe
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield ('+Inf' if bound == float('inf') else f'{bound:g}'), total
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+_current = ContextVar('webdorm_request_stats', default=None)
+
+
+class Registry:
+    HISTOGRAMS = {
+        'webdorm_request_duration_seconds': ("Request latency", DURATION_BUCKETS),
+        'webdorm_request_db_queries': ("DB queries per request", QUERY_COUNT_BUCKETS),
+        'webdorm_request_db_seconds': ("DB time per request", DURATION_BUCKETS),
+        'webdorm_request_template_seconds': ("Template render time per request", DURATION_BUCKETS),
+        'webdorm_response_size_bytes': ("Response body size", SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {} #(metric, view) -> Histogram
+        self.requests = {} #(view, status) -> tedad
+        self.db = {} #alias DB (default / replica_1 ...) -> [tedad query, zaman]
+
+    def record(self, view, status, duration, stats, size):
+        values = {
+            'webdorm_request_duration_seconds': duration,
+            'webdorm_request_db_queries': stats.queries,
+            'webdorm_request_db_seconds': stats.db_seconds,
+            'webdorm_request_template_seconds': stats.template_seconds,
+        }
+        if size is not None:
+            values['webdorm_response_size_bytes'] = size
+        with self._lock:
+            self.requests[view, status] = self.requests.get((view, status), 0) + 1
+            for metric, value in values.items():
+                histogram = self.histograms.get((metric, view))
+                if histogram is None:
+                    histogram = self.histograms[metric, view] = Histogram(self.HISTOGRAMS[metric][1])
+                histogram.observe(value)
+
+    def record_query(self, alias, elapsed):
+        with self._lock:
+            totals = self.db.get(alias)
+            if totals is None:
+                totals = self.db[alias] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += elapsed
+
+    def render(self):
+        lines = ['# HELP webdorm_requests_total Requests per view and status', '# TYPE webdorm_requests_total counter']
+        with self._lock:
+            for (view, status), count in sorted(self.requests.items()):
+                lines.append(f'webdorm_requests_total{{view="{view}",status="{status}"}} {count}')
+            lines += ['# HELP webdorm_db_queries_total Queries per database alias', '# TYPE webdorm_db_queries_total counter']
+            lines += [f'webdorm_db_queries_total{{alias="{alias}"}} {count}' for alias, (count, _) in sorted(self.db.items())]
+            lines += ['# HELP webdorm_db_seconds_total Query time per database alias', '# TYPE webdorm_db_seconds_total counter']
+            lines += [f'webdorm_db_seconds_total{{alias="{alias}"}} {seconds}' for alias, (_, seconds) in sorted(self.db.items())]
+            for metric, (help_text, _) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (name, view), histogram in sorted(self.histograms.items()):
+                    if name == metric:
+                        lines.extend(histogram_lines(metric, histogram, f'view="{view}"'))
+        return lines
+
+
+def histogram_lines(metric, histogram, labels=''):
+    prefix = f'{labels},' if labels else ''
+    for bound, total in histogram.cumulative():
+        yield f'{metric}_bucket{{{prefix}le="{bound}"}} {total}'
+    suffix = f'{{{labels}}}' if labels else ''
+    yield f'{metric}_sum{suffix} {histogram.sum}'
+    yield f'{metric}_count{suffix} {histogram.count}'
+
+
+registry = Registry()
+
+
+def render_prometheus():
+    from .hashing import pool
+
+    lines = registry.render()
+    snapshot = pool.snapshot()
+    lines += [
+        '# TYPE webdorm_password_hash_queue_depth gauge',
+        f"webdorm_password_hash_queue_depth {snapshot['queue_depth']}",
+        '# TYPE webdorm_password_hash_queue_limit gauge',
+        f"webdorm_password_hash_queue_limit {snapshot['queue_limit']}",
+        '# TYPE webdorm_password_hash_rejected_total counter',
+        f"webdorm_password_hash_rejected_total {snapshot['rejected_total']}",
+        '# TYPE webdorm_password_hash_duration_seconds histogram',
+    ]
+    lines += histogram_lines('webdorm_password_hash_duration_seconds', pool.latency)
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, duration):
+        #javab streaming (SSE / export) hajm nadare; zamanesh ham faghat ta ersal header ast
+        size = None if response.streaming else len(response.content)
+        registry.record(view_label(request), response.status_code, duration, stats, size)
+
+
+def record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.record_query(context['connection'].alias, elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        threshold = settings.SLOW_QUERY_MS
+        if threshold and elapsed * 1000 >= threshold:
+            log_slow_query(sql, elapsed, context['connection'].alias)
+
+
+def log_slow_query(sql, elapsed, alias):
+    #stack faghat baraye query haye kond sakhte mishe; faghat frame haye khode project
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in frame.filename and frame.filename != __file__
+    ]
+    stack = ''.join(traceback.format_list(frames[-8:]))
+    slow_query_logger.warning("slow query (%.0f ms, %s): %s\n%s", elapsed * 1000, alias, sql, stack)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_wrapper, dispatch_uid='webdorm_metrics_query_wrapper')
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    #hamoon DjangoTemplates; faghat zaman render har template asli (na include ha) shomorde mishe
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
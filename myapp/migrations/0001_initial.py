@@ -0,0 +1,185 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dorm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='نام خوابگاه')),
+                ('gender', models.CharField(choices=[('male', 'آقایان'), ('female', 'خانم ها'), ('married', 'متاهلی')], max_length=8, verbose_name='جنسیت دانشجویان')),
+                ('is_active', models.BooleanField(default=True, verbose_name='وضعیت فعال بودن')),
+            ],
+            options={
+                'verbose_name': 'خوابگاه',
+                'verbose_name_plural': 'خوابگاه ها',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Notice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=128, verbose_name='عنوان')),
+                ('text', models.TextField(verbose_name='متن')),
+                ('date_modified', models.DateField(auto_now_add=True, verbose_name='زمان بارگذاری')),
+            ],
+            options={
+                'verbose_name': 'اطلاعیه',
+                'verbose_name_plural': 'اطلاعیه ها',
+                'ordering': ['-date_modified'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OtherInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_selectroom_event', models.DateTimeField(verbose_name='آغاز زمان انتخاب اتاق')),
+                ('end_selectroom_event', models.DateTimeField(verbose_name='پایان زمان انتخاب اتاق')),
+            ],
+            options={
+                'verbose_name': 'تنظیمات زمان\u200cبندی',
+                'verbose_name_plural': 'تنظیمات زمان\u200cبندی',
+            },
+        ),
+        migrations.CreateModel(
+            name='SelectionCohort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_selectroom_event', models.DateTimeField(verbose_name='آغاز زمان انتخاب اتاق')),
+                ('end_selectroom_event', models.DateTimeField(verbose_name='پایان زمان انتخاب اتاق')),
+                ('name', models.CharField(max_length=64, verbose_name='نام گروه')),
+                ('kind', models.CharField(choices=[('entry_year', 'سال ورود (پیشوند شماره دانشجویی)'), ('gender', 'جنسیت'), ('lottery', 'قرعه کشی')], max_length=16, verbose_name='نوع گروه بندی')),
+                ('value', models.CharField(help_text='سال ورود: پیشوند شماره دانشجویی (مثلا 403) | جنسیت: male / female / married | قرعه کشی: شماره گروه (1، 2، ...)', max_length=16, verbose_name='مقدار')),
+                ('priority', models.PositiveIntegerField(default=0, help_text='اولین گروه منطبق (کمترین عدد) زمان دانشجو را تعیین می\u200cکند', verbose_name='اولویت')),
+            ],
+            options={
+                'verbose_name': 'گروه زمان\u200cبندی',
+                'verbose_name_plural': 'گروه\u200cهای زمان\u200cبندی انتخاب اتاق',
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('first_name', models.CharField(max_length=20, verbose_name='نام')),
+                ('last_name', models.CharField(max_length=20, verbose_name='نام خانوادگی')),
+                ('national_code', models.CharField(max_length=10, unique=True, verbose_name='کد ملی')),
+                ('student_code', models.CharField(max_length=9, unique=True, verbose_name='شماره دانشجویی')),
+                ('payed_cost', models.BooleanField(default=False, verbose_name='وضعیت پرداخت هزینه اتاق')),
+                ('gender', models.CharField(blank=True, choices=[('male', 'آقایان'), ('female', 'خانم ها'), ('married', 'متاهلی')], max_length=8, verbose_name='جنسیت / نوع خوابگاه')),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'کاربر',
+                'verbose_name_plural': 'کاربران',
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Block',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='نام بلوک')),
+                ('floor_count', models.PositiveIntegerField(verbose_name='تعداد طبقه')),
+                ('floor_rooms', models.PositiveIntegerField(verbose_name='تعداد اتاق در هر طبقه')),
+                ('default_room_capacity', models.PositiveIntegerField(default=6, verbose_name='ظرفیت پیش\u200c فرض هر اتاق')),
+                ('room_costs', models.PositiveIntegerField(verbose_name='هزینه اتاق ها')),
+                ('is_active', models.BooleanField(default=True, verbose_name='وضعیت فعال بودن')),
+                ('supervisor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='مدیر بلوک')),
+                ('placed_in', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='myapp.dorm', verbose_name='در خوابگاه')),
+            ],
+            options={
+                'verbose_name': 'بلوک',
+                'verbose_name_plural': 'بلوک ها',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='شماره اتاق')),
+                ('floor_number', models.IntegerField(verbose_name='طبقه اتاق')),
+                ('room_cost', models.IntegerField(default=0, verbose_name='هزینه اتاق')),
+                ('capacity', models.IntegerField(default=6, verbose_name='ظرفیت اتاق')),
+                ('is_active', models.BooleanField(default=True, verbose_name='وضعیت فعال بودن')),
+                ('current_occupancy', models.PositiveIntegerField(default=0, editable=False, verbose_name='تعداد ساکنین')),
+                ('held_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='جای رزرو موقت')),
+                ('placed_in', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='myapp.block', verbose_name='در بلوک')),
+            ],
+            options={
+                'verbose_name': 'اتاق',
+                'verbose_name_plural': 'اتاق ها',
+                'ordering': ['number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='placed_in',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='myapp.room', verbose_name='محل دانشجو'),
+        ),
+        migrations.CreateModel(
+            name='RoomHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='زمان پایان رزرو موقت')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='myapp.room', verbose_name='اتاق')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='room_hold', to=settings.AUTH_USER_MODEL, verbose_name='دانشجو')),
+            ],
+            options={
+                'verbose_name': 'رزرو موقت',
+                'verbose_name_plural': 'رزروهای موقت',
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomAvailability',
+            fields=[
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability', serialize=False, to='myapp.room')),
+                ('dorm_name', models.CharField(max_length=64)),
+                ('block_name', models.CharField(max_length=64)),
+                ('number', models.PositiveIntegerField()),
+                ('floor_number', models.IntegerField()),
+                ('room_cost', models.IntegerField()),
+                ('capacity', models.IntegerField()),
+                ('occupancy', models.IntegerField()),
+                ('free_slots', models.IntegerField()),
+                ('is_listed', models.BooleanField()),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.block')),
+                ('dorm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.dorm')),
+            ],
+            options={
+                'verbose_name': 'ظرفیت خالی اتاق',
+                'verbose_name_plural': 'ظرفیت خالی اتاق ها',
+            },
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='roomavailability',
+            name='block',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='myapp.block'),
+        ),
+        migrations.AlterField(
+            model_name='roomavailability',
+            name='dorm',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='myapp.dorm'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['is_active', 'placed_in', 'floor_number'], name='room_active_block_floor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['placed_in', 'floor_number', 'number'], name='room_block_floor_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['floor_number'], name='room_floor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['number'], name='room_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['room_cost', 'number'], name='room_cost_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['number'], name='avail_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['dorm', 'floor_number', 'number'], name='avail_dorm_floor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['block', 'floor_number', 'number'], name='avail_block_floor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['floor_number', 'number'], name='avail_floor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['room_cost', 'number'], name='avail_cost_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['-room_cost', 'number'], name='avail_cost_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['free_slots', 'number'], name='avail_free_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['-free_slots', 'number'], name='avail_free_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['dorm', 'version'], name='avail_dorm_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['block', 'version'], name='avail_block_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomavailability',
+            index=models.Index(fields=['version'], name='avail_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomhold',
+            index=models.Index(fields=['room', 'expires_at'], name='hold_room_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['payed_cost', 'placed_in'], name='user_paid_room_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['placed_in', 'id'], name='user_room_idx'),
+        ),
+    ]
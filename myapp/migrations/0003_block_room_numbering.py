@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='block',
+            name='room_numbering',
+            field=models.CharField(choices=[('floor_hundreds', 'طبقه × ۱۰۰ (101، 102، ... 201)'), ('floor_thousands', 'طبقه × ۱۰۰۰ (1001، 1002، ... 2001)'), ('sequential', 'پشت سر هم در کل بلوک (1، 2، 3، ...)')], default='floor_hundreds', max_length=16, verbose_name='شماره گذاری اتاق ها'),
+        ),
+    ]
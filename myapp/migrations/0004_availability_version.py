@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_counter(apps, schema_editor):
+    #counter az bozorgtarin version mojood shoroo mishe ta version ha aghab nayan
+    RoomAvailability = apps.get_model('myapp', 'RoomAvailability')
+    AvailabilityVersion = apps.get_model('myapp', 'AvailabilityVersion')
+    latest = RoomAvailability.objects.aggregate(v=Max('version'))['v'] or 0
+    AvailabilityVersion.objects.create(pk=1, value=latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_block_room_numbering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'نسخه ظرفیت اتاق ها',
+            },
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_availability_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notice',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='زمان آخرین ویرایش'),
+            preserve_default=False,
+        ),
+    ]
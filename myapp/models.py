@@ -1,5 +1,30 @@
-from django.db import models
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, Min, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from .caching import get_cached, clear_cached
+from .routing import primary
+
+class GenderChoices(models.TextChoices):
+    male = "male", "آقایان"
+    female = "female", "خانم ها"
+    married = "married", "متاهلی"
+
+
+class RoomNumberingChoices(models.TextChoices):
+    floor_hundreds = "floor_hundreds", "طبقه × ۱۰۰ (101، 102، ... 201)"
+    floor_thousands = "floor_thousands", "طبقه × ۱۰۰۰ (1001، 1002، ... 2001)"
+    sequential = "sequential", "پشت سر هم در کل بلوک (1، 2، 3، ...)"
+
 
 class User(AbstractUser):
     first_name = models.CharField(max_length=20, verbose_name='نام')
@@ -8,6 +33,7 @@ class User(AbstractUser):
     student_code = models.CharField(max_length=9, verbose_name='شماره دانشجویی',unique=True)
     placed_in = models.ForeignKey('Room', on_delete=models.SET_NULL, null=True, blank=True, verbose_name='محل دانشجو', related_name='students')
     payed_cost = models.BooleanField(verbose_name='وضعیت پرداخت هزینه اتاق', default=False)
+    gender = models.CharField(max_length=8, choices=GenderChoices, verbose_name='جنسیت / نوع خوابگاه', blank=True)
 
     def __str__(self):
 
@@ -18,51 +44,248 @@ class User(AbstractUser):
             text += " [ دانشجو ]"
         return text
 
+    def save(self, *args, **kwargs):
+        #save kamel (admin / profile) placed_in ro nemineviseh: noskhe ghadimi dakhel hafeze nabayad
+        # jabejayi hamzaman move_to_room ro bargardune
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'placed_in'
+            ]
+        super().save(*args, **kwargs)
+
+    def move_to_room(self, room):
+        # placed_in faghat az in masir avaz mishe ta shomarande ye otagh ha ba User.placed_in yeki bemune
+        # room=None yani khorooj az otagh. agar otagh jadid por bashe False barmigardune va hichi avaz nemishe
+        # agar daneshjoo rooye hamin otagh hold faal dashte bashe, hamoon ja be sakonat tabdil mishe
+        new_room_id = room.pk if room is not None else None
+        with transaction.atomic(), RoomAvailability.batch():
+            current_room_id = User.objects.select_for_update().values_list('placed_in_id', flat=True).get(pk=self.pk)
+            hold = RoomHold.objects.filter(user_id=self.pk).first()
+            Room.lock({current_room_id, new_room_id, hold.room_id if hold is not None else None})
+            if new_room_id is not None and RoomHold.release_expired(room_ids=[new_room_id]):
+                hold = RoomHold.objects.filter(user_id=self.pk).first()
+
+            if current_room_id != new_room_id:
+                if new_room_id is not None:
+                    #delete count check mishe ta agar sweep hamzaman hold ro azad karde bashe do bar kam nashe
+                    if (hold is not None and hold.room_id == new_room_id
+                            and RoomHold.objects.filter(pk=hold.pk).delete()[0]):
+                        hold = None
+                        Room.convert_hold(new_room_id)
+                    elif not Room.take_slot(new_room_id):
+                        return False
+                if current_room_id is not None:
+                    Room.release_slot(current_room_id)
+                User.objects.filter(pk=self.pk).update(placed_in=new_room_id)
+
+            if hold is not None:
+                RoomHold.release(hold)
+        self.placed_in = room
+        return True
+
     class Meta:
         verbose_name = "کاربر"
         verbose_name_plural = "کاربران"
-
-class OtherInfo(models.Model):
+        indexes = [
+            #takhsis khodkar / filter admin: pardakht karde va bedoon otagh
+            models.Index(fields=['payed_cost', 'placed_in'], name='user_paid_room_idx'),
+            #ham otaghi ha (my_room_page): placed_in = X bedoon sort joda
+            models.Index(fields=['placed_in', 'id'], name='user_room_idx'),
+        ]
+
+class SelectionWindow(models.Model):
     start_selectroom_event = models.DateTimeField(verbose_name='آغاز زمان انتخاب اتاق')
     end_selectroom_event = models.DateTimeField(verbose_name='پایان زمان انتخاب اتاق')
 
+    def selection_window_error(self, now=None):
+        #None yani alan dar baze entekhab otagh hastim
+        now = now or timezone.now()
+        if self.start_selectroom_event and now < self.start_selectroom_event:
+            return "زمان انتخاب اتاق هنوز فرا نرسیده است."
+        if self.end_selectroom_event and now > self.end_selectroom_event:
+            return "مهلت انتخاب اتاق به پایان رسیده است."
+        return None
+
+    class Meta:
+        abstract = True
+
+
+class OtherInfo(SelectionWindow):
+
     def __str__(self):
         return "تنظیمات زمان بندی"
 
+    CACHE_KEY = 'webdorm:otherinfo'
+    CACHE_TIMEOUT = 60
+
     def save(self, *args, **kwargs):
         self.pk = 1
         super().save(*args, **kwargs)
 
     @classmethod
     def get_instance(cls):
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
+        #noskhe cache shode; faghat baraye khundan (taghirat az admin va save anjam beshe)
+        return get_cached(cls.CACHE_KEY, lambda: cls.objects.get_or_create(pk=1)[0], cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def clear_cache(cls):
+        clear_cached(cls.CACHE_KEY)
 
     class Meta:
         verbose_name = "تنظیمات زمان‌بندی"
         verbose_name_plural = "تنظیمات زمان‌بندی"
 
 
+class SelectionCohort(SelectionWindow):
+    #baze entekhab otagh jodagane baraye har goroh ta hame daneshjoo ha ba ham vared nashan
+    class KindChoices(models.TextChoices):
+        entry_year = "entry_year", "سال ورود (پیشوند شماره دانشجویی)"
+        gender = "gender", "جنسیت"
+        lottery = "lottery", "قرعه کشی"
+
+    name = models.CharField(max_length=64, verbose_name='نام گروه')
+    kind = models.CharField(max_length=16, choices=KindChoices, verbose_name='نوع گروه بندی')
+    value = models.CharField(
+        max_length=16, verbose_name='مقدار',
+        help_text='سال ورود: پیشوند شماره دانشجویی (مثلا 403) | جنسیت: male / female / married | قرعه کشی: شماره گروه (1، 2، ...)',
+    )
+    priority = models.PositiveIntegerField(verbose_name='اولویت', default=0, help_text='اولین گروه منطبق (کمترین عدد) زمان دانشجو را تعیین می‌کند')
+
+    CACHE_KEY = 'webdorm:selection_cohorts'
+    CACHE_TIMEOUT = 60
+
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()}: {self.value})"
+
+    @classmethod
+    def get_all(cls):
+        return get_cached(cls.CACHE_KEY, lambda: list(cls.objects.order_by('priority', 'pk')), cls.CACHE_TIMEOUT)
+
+    @classmethod
+    def clear_cache(cls):
+        clear_cached(cls.CACHE_KEY)
+
+    @staticmethod
+    def lottery_group(student_code, group_count):
+        #hash sabet (na hash() python ke beyn process ha fargh dare) -> 1..group_count
+        digest = hashlib.sha256(student_code.encode()).digest()
+        return int.from_bytes(digest[:8], 'big') % group_count + 1
+
+    @classmethod
+    def resolve(cls, student_code, gender, cohorts=None):
+        cohorts = cls.get_all() if cohorts is None else cohorts
+        lottery_count = sum(1 for c in cohorts if c.kind == cls.KindChoices.lottery)
+        for cohort in cohorts:
+            if cohort.kind == cls.KindChoices.entry_year:
+                if student_code.startswith(cohort.value):
+                    return cohort
+            elif cohort.kind == cls.KindChoices.gender:
+                if gender and gender == cohort.value:
+                    return cohort
+            elif cohort.kind == cls.KindChoices.lottery:
+                if cohort.value == str(cls.lottery_group(student_code, lottery_count)):
+                    return cohort
+        return None
+
+    @classmethod
+    def window_for(cls, user):
+        #baze daneshjoo: goroh montabegh, dar gheir in soorat baze kolli OtherInfo
+        return cls.resolve(user.student_code, user.gender) or OtherInfo.get_instance()
+
+    @classmethod
+    def window_error_for(cls, user, now=None):
+        return cls.window_for(user).selection_window_error(now)
+
+    @classmethod
+    def projected_concurrency(cls, bucket_minutes=15):
+        #pish bini: chand daneshjoo dar har baze zamani dastresi migiran (baraye safhe admin)
+        cohorts = list(cls.objects.order_by('priority', 'pk'))
+        default_start = OtherInfo.get_instance().start_selectroom_event
+        bucket_seconds = bucket_minutes * 60
+        buckets = Counter()
+        students = User.objects.filter(payed_cost=True, is_staff=False).values_list('student_code', 'gender')
+        for student_code, gender in students.iterator(chunk_size=5000):
+            cohort = cls.resolve(student_code, gender, cohorts)
+            start = cohort.start_selectroom_event if cohort else default_start
+            if start is None:
+                continue
+            timestamp = int(start.timestamp())
+            buckets[timestamp - timestamp % bucket_seconds] += 1
+        return [
+            (datetime.fromtimestamp(ts, tz=dt_timezone.utc), count)
+            for ts, count in sorted(buckets.items())
+        ]
+
+    class Meta:
+        verbose_name = "گروه زمان‌بندی"
+        verbose_name_plural = "گروه‌های زمان‌بندی انتخاب اتاق"
+        ordering = ['priority', 'id']
+
+
+class DormQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        #zarfiat va jamiat kol ba yek GROUP BY (bejaye halghe rooye block ha va otagh ha)
+        return self.annotate(
+            capacity_sum=Coalesce(Sum('block__room__capacity'), 0),
+            population_sum=Coalesce(Sum('block__room__current_occupancy'), 0),
+        )
+
+
 class Dorm(models.Model):
-    class GenderChoices(models.TextChoices):
-        male = "male", "آقایان"
-        female = "female", "خانم ها"
-        married = "married", "متاهلی"
+    GenderChoices = GenderChoices
 
     name = models.CharField(max_length=64, verbose_name='نام خوابگاه')
     gender = models.CharField(max_length=8, choices=GenderChoices, verbose_name='جنسیت دانشجویان')
     is_active = models.BooleanField(verbose_name='وضعیت فعال بودن', default=True)
 
+    objects = DormQuerySet.as_manager()
+
+    FILTER_CACHE_KEY = 'webdorm:room_filter_choices'
+    FILTER_CACHE_TIMEOUT = 300
+
     def __str__(self):
         return f"{self.name} ({self.get_gender_display()})"
 
+    @classmethod
+    def filter_choices(cls):
+        #dade haye dropdown safhe entekhab otagh: khabgah haye faal ba block haye faal har kodoom + list tabaghe ha
+        return get_cached(cls.FILTER_CACHE_KEY, cls._load_filter_choices, cls.FILTER_CACHE_TIMEOUT)
+
+    @classmethod
+    def _load_filter_choices(cls):
+        dorms = {pk: {'id': pk, 'name': name, 'blocks': []} for pk, name in cls.objects.filter(is_active=True).values_list('pk', 'name')}
+        max_floors = 0
+        blocks = Block.objects.filter(is_active=True, placed_in__is_active=True).values_list('pk', 'name', 'placed_in_id', 'floor_count')
+        for pk, name, dorm_id, floor_count in blocks:
+            dorms[dorm_id]['blocks'].append({'id': pk, 'name': name})
+            max_floors = max(max_floors, floor_count)
+        return {'dorms': list(dorms.values()), 'floors': list(range(1, max_floors + 1))}
+
+    @classmethod
+    def clear_filter_cache(cls):
+        clear_cached(cls.FILTER_CACHE_KEY)
+
+    def _load_occupancy(self):
+        #baraye object hayi ke ba with_occupancy() khunde nashodan: yek query aggregate
+        totals = Room.objects.filter(placed_in__placed_in=self).aggregate(
+            capacity_sum=Coalesce(Sum('capacity'), 0),
+            population_sum=Coalesce(Sum('current_occupancy'), 0),
+        )
+        self.capacity_sum = totals['capacity_sum']
+        self.population_sum = totals['population_sum']
+
     @property
     def total_capacity(self):
-        return sum(block.total_capacity for block in self.block_set.all())
+        if not hasattr(self, 'capacity_sum'):
+            self._load_occupancy()
+        return self.capacity_sum
 
     @property
     def current_population(self):
-        return sum(block.current_population for block in self.block_set.all())
+        if not hasattr(self, 'population_sum'):
+            self._load_occupancy()
+        return self.population_sum
 
     class Meta:
         verbose_name = "خوابگاه"
@@ -70,6 +293,14 @@ class Dorm(models.Model):
         ordering = ['-id']
 
 
+class BlockQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        return self.annotate(
+            capacity_sum=Coalesce(Sum('room__capacity'), 0),
+            population_sum=Coalesce(Sum('room__current_occupancy'), 0),
+        )
+
+
 class Block(models.Model):
     name = models.CharField(max_length=64, verbose_name='نام بلوک')
     placed_in = models.ForeignKey(Dorm, on_delete=models.PROTECT, verbose_name='در خوابگاه')
@@ -79,19 +310,39 @@ class Block(models.Model):
     room_costs = models.PositiveIntegerField(verbose_name='هزینه اتاق ها')
     supervisor = models.ForeignKey(User, on_delete=models.SET_NULL, verbose_name='مدیر بلوک', null=True, blank=True)
     is_active = models.BooleanField(verbose_name='وضعیت فعال بودن', default=True)
+    room_numbering = models.CharField(
+        max_length=16, choices=RoomNumberingChoices, default=RoomNumberingChoices.floor_hundreds,
+        verbose_name='شماره گذاری اتاق ها',
+    )
+
+    objects = BlockQuerySet.as_manager()
+
+    ROOM_BATCH_SIZE = 1000
 
     def __str__(self):
         return f"{self.name} در خوابگاه {self.placed_in.__str__()}"
 
+    def _load_occupancy(self):
+        totals = self.room_set.aggregate(
+            capacity_sum=Coalesce(Sum('capacity'), 0),
+            population_sum=Coalesce(Sum('current_occupancy'), 0),
+        )
+        self.capacity_sum = totals['capacity_sum']
+        self.population_sum = totals['population_sum']
+
     @property
     def total_capacity(self):
-        return sum(room.capacity for room in self.room_set.all())
+        if not hasattr(self, 'capacity_sum'):
+            self._load_occupancy()
+        return self.capacity_sum
 
     @property
     def current_population(self):
-        return sum(room.current_occupancy for room in self.room_set.all())
+        if not hasattr(self, 'population_sum'):
+            self._load_occupancy()
+        return self.population_sum
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, create_rooms=True, **kwargs):
         if self.placed_in.gender == 'married':
             self.default_room_capacity = 2
             
@@ -99,25 +350,87 @@ class Block(models.Model):
         super().save(*args, **kwargs)
         
 
-        if is_new:
+        if is_new and create_rooms:
             self.create_rooms_automatically()
 
-    def create_rooms_automatically(self):
-        rooms_list = []
-        for i in range(self.floor_count):
-            current_floor = i + 1
-            floor_prefix = current_floor * 100
-            
+    def room_numbers(self):
+        #(tabaghe, shomare) baraye har otagh bar asas room_numbering
+        for floor in range(1, self.floor_count + 1):
             for r in range(1, self.floor_rooms + 1):
-                rooms_list.append(Room(
-                    number=floor_prefix + r,
-                    floor_number=current_floor,
-                    room_cost=self.room_costs,
-                    placed_in=self,
-                    capacity=self.default_room_capacity,
-                    is_active=True
-                ))
-        Room.objects.bulk_create(rooms_list)
+                if self.room_numbering == RoomNumberingChoices.sequential:
+                    yield floor, (floor - 1) * self.floor_rooms + r
+                elif self.room_numbering == RoomNumberingChoices.floor_thousands:
+                    yield floor, floor * 1000 + r
+                else:
+                    yield floor, floor * 100 + r
+
+    def create_rooms_automatically(self):
+        #dasteh haye ROOM_BATCH_SIZE-i (na yek list kamel az hame otagh ha dar hafeze)
+        rooms = (
+            Room(
+                number=number, floor_number=floor, room_cost=self.room_costs, placed_in=self,
+                capacity=self.default_room_capacity, is_active=True,
+            )
+            for floor, number in self.room_numbers()
+        )
+        with transaction.atomic():
+            while batch := list(islice(rooms, self.ROOM_BATCH_SIZE)):
+                Room.objects.bulk_create(batch)
+            RoomAvailability.refresh(Room.objects.filter(placed_in=self))
+
+    def clone(self, name, placed_in=None):
+        """
+        block jadid ba hamoon tanzimat va chideman otagh ha (ba taghirat dasti otagh ha), bedoon sakenin.
+        """
+        with transaction.atomic():
+            block = Block(
+                name=name, placed_in=placed_in or self.placed_in, floor_count=self.floor_count,
+                floor_rooms=self.floor_rooms, default_room_capacity=self.default_room_capacity,
+                room_costs=self.room_costs, supervisor=None, is_active=self.is_active,
+                room_numbering=self.room_numbering,
+            )
+            block.save(create_rooms=False)
+            rooms = (
+                Room(number=number, floor_number=floor, room_cost=cost, placed_in=block, capacity=capacity, is_active=active)
+                for number, floor, cost, capacity, active in
+                list(self.room_set.order_by('pk').values_list('number', 'floor_number', 'room_cost', 'capacity', 'is_active'))
+            )
+            while batch := list(islice(rooms, self.ROOM_BATCH_SIZE)):
+                Room.objects.bulk_create(batch)
+            RoomAvailability.refresh(Room.objects.filter(placed_in=block))
+        return block
+
+    def update_rooms(self, floors=None, room_cost=None, capacity=None, is_active=None):
+        """
+        taghir hazine / zarfiat / faal boodan hame otagh haye block (ya faghat tabaghat floors) ba yek UPDATE.
+        zarfiat kamtar az sakenin + hold yek otagh: hamoon UPDATE sharti kamtar satr avaz mikone va
+        kol taghir rad mishe (ValidationError, rollback).
+        """
+        changes = {
+            field: value for field, value in
+            (('room_cost', room_cost), ('capacity', capacity), ('is_active', is_active)) if value is not None
+        }
+        if not changes:
+            return 0
+        rooms = Room.objects.filter(placed_in=self)
+        if floors:
+            rooms = rooms.filter(floor_number__in=floors)
+
+        with transaction.atomic():
+            target = rooms
+            if capacity is not None:
+                target = rooms.filter(current_occupancy__lte=capacity - F('held_count'))
+            updated = target.update(**changes)
+            if capacity is not None and updated != rooms.count():
+                crowded = list(
+                    rooms.filter(current_occupancy__gt=capacity - F('held_count')).order_by('number')
+                    .values_list('number', flat=True)[:20]
+                )
+                raise ValidationError(
+                    f"ظرفیت {capacity} از تعداد ساکنین این اتاق ها کمتر است: {', '.join(map(str, crowded))}"
+                )
+            RoomAvailability.refresh(rooms)
+        return updated
 
     class Meta:
         verbose_name = "بلوک"
@@ -132,30 +445,432 @@ class Room(models.Model):
     placed_in = models.ForeignKey(Block, on_delete=models.PROTECT, verbose_name='در بلوک')
     capacity = models.IntegerField(verbose_name='ظرفیت اتاق', default=6)
     is_active = models.BooleanField(verbose_name='وضعیت فعال بودن', default=True)
+    #tedad sakenin; faghat ba take_slot / release_slot avaz mishe (baraye dorost kardan: manage.py reconcile_occupancy)
+    current_occupancy = models.PositiveIntegerField(verbose_name='تعداد ساکنین', default=0, editable=False)
+    #tedad jaye nagah dashte shode (RoomHold); ta vaghti hold azad nashode jozv zarfiat por hesab mishe
+    held_count = models.PositiveIntegerField(verbose_name='جای رزرو موقت', default=0, editable=False)
+
+    FLOORS_CACHE_KEY = 'webdorm:room_floors'
+    FLOORS_CACHE_TIMEOUT = 300
 
     def __str__(self):
         return f"{self.number} بلوک {self.placed_in.name} خوابگاه {self.placed_in.placed_in.name}"
 
-    @property
-    def current_occupancy(self):
-        return self.students.count()
+    @classmethod
+    def floor_numbers(cls):
+        #DISTINCT dar khode DB + cache (ba taghir block / otagh pak mishe)
+        floors = cache.get(cls.FLOORS_CACHE_KEY)
+        if floors is None:
+            with primary():
+                floors = list(cls.objects.order_by('floor_number').values_list('floor_number', flat=True).distinct())
+            cache.set(cls.FLOORS_CACHE_KEY, floors, cls.FLOORS_CACHE_TIMEOUT)
+        return floors
+
+    @classmethod
+    def lock(cls, room_ids):
+        #tartib ghofl dar hame masir ha: User -> Room (be tartib pk) -> RoomHold -> counter version (RoomAvailability.batch)
+        room_ids = sorted(pk for pk in room_ids if pk is not None)
+        if room_ids:
+            list(cls.objects.select_for_update().filter(pk__in=room_ids).order_by('pk').values_list('pk', flat=True))
+
+    @classmethod
+    def take_slot(cls, pk):
+        #yek update sharti: faghat agar hanooz ja dashte bashe yeki ezafe mishe (bedoon race beyn do request)
+        updated = cls.objects.filter(pk=pk, current_occupancy__lt=F('capacity') - F('held_count')).update(
+            current_occupancy=F('current_occupancy') + 1
+        )
+        if updated:
+            RoomAvailability.apply(occupancy={pk: 1})
+        return updated == 1
+
+    @classmethod
+    def take_hold_slot(cls, pk):
+        updated = cls.objects.filter(pk=pk, current_occupancy__lt=F('capacity') - F('held_count')).update(
+            held_count=F('held_count') + 1
+        )
+        if updated:
+            RoomAvailability.apply(held={pk: 1})
+        return updated == 1
+
+    @classmethod
+    def release_hold_slot(cls, pk, count=1):
+        updated = cls.objects.filter(pk=pk, held_count__gte=count).update(held_count=F('held_count') - count)
+        if updated:
+            RoomAvailability.apply(held={pk: -count})
+        return updated == 1
+
+    @classmethod
+    def convert_hold(cls, pk):
+        #ja az ghabl gerefte shode; faghat az hold be sakonat montaghel mishe
+        updated = cls.objects.filter(pk=pk, held_count__gt=0).update(
+            held_count=F('held_count') - 1,
+            current_occupancy=F('current_occupancy') + 1,
+        )
+        if updated:
+            RoomAvailability.apply(occupancy={pk: 1}, held={pk: -1})
+        return updated == 1
+
+    @classmethod
+    def release_slot(cls, pk):
+        updated = cls.objects.filter(pk=pk, current_occupancy__gt=0).update(
+            current_occupancy=F('current_occupancy') - 1
+        )
+        if updated:
+            RoomAvailability.apply(occupancy={pk: -1})
+        return updated == 1
 
     @property
     def free_capacity(self):
-        return self.capacity - self.current_occupancy
+        return self.capacity - self.current_occupancy - self.held_count
 
     class Meta:
         verbose_name = "اتاق"
         verbose_name_plural = "اتاق ها"
         ordering = ['number']
+        indexes = [
+            #filter haye admin (faal / block / tabaghe) + sort pishfarz
+            models.Index(fields=['is_active', 'placed_in', 'floor_number'], name='room_active_block_floor_idx'),
+            models.Index(fields=['placed_in', 'floor_number', 'number'], name='room_block_floor_number_idx'),
+            models.Index(fields=['floor_number'], name='room_floor_idx'),
+            models.Index(fields=['number'], name='room_number_idx'),
+            models.Index(fields=['room_cost', 'number'], name='room_cost_number_idx'),
+        ]
+
+
+def _delta_case(deltas):
+    #{room_id: taghir} -> Case ba yek When be ezaye har meghdar motefavet (na har otagh)
+    rooms_by_delta = defaultdict(list)
+    for room_id, delta in deltas.items():
+        if delta:
+            rooms_by_delta[delta].append(room_id)
+    return Case(
+        *[When(room_id__in=ids, then=Value(delta)) for delta, ids in rooms_by_delta.items()],
+        default=Value(0),
+    )
+
+
+#taghirat RoomAvailability.batch() baraye thread / task feli: (occupancy, held)
+_pending_changes = ContextVar('webdorm_availability_changes', default=None)
+
+
+class AvailabilityVersion(models.Model):
+    #counter version RoomAvailability (yek satr). UPDATE in satr ghofl ro ta commit negah midare, pas
+    # version ha be tartib commit dade mishan: transaction dir commit shode version kamtar az version dide shode nemigire
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "نسخه ظرفیت اتاق ها"
+
+
+class RoomAvailability(models.Model):
+    #jadval materialize shode baraye list otagh haye daneshjoo: yek satr be ezaye har otagh,
+    # bedoon join ba Block / Dorm / User. counter ha ba Room.take_slot va ... hamzaman jabeja mishan,
+    # taghirat admin ba signal ha refresh mishan (baraye sakht dobare: manage.py rebuild_availability)
+    room = models.OneToOneField(Room, on_delete=models.CASCADE, primary_key=True, related_name='availability')
+    #index haye tak sotoni lazem nist; index haye Meta ba dorm / block shoroo mishan
+    dorm = models.ForeignKey(Dorm, on_delete=models.CASCADE, db_index=False)
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, db_index=False)
+    dorm_name = models.CharField(max_length=64)
+    block_name = models.CharField(max_length=64)
+    number = models.PositiveIntegerField()
+    floor_number = models.IntegerField()
+    room_cost = models.IntegerField()
+    capacity = models.IntegerField()
+    occupancy = models.IntegerField()
+    free_slots = models.IntegerField()
+    #otagh, block va khabgah hame faal
+    is_listed = models.BooleanField()
+    #shomare taghir (ETag / delta API): ba har taghir satr az AvailabilityVersion gerefte mishe
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    REFRESH_BATCH_SIZE = 1000
+    SCOPE_CACHE_TIMEOUT = 300
+
+    def __str__(self):
+        return f"{self.number} بلوک {self.block_name} خوابگاه {self.dorm_name}"
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """
+        apply haye dakhel block jam mishan va akhar block ba yek apply zakhire mishan: counter version
+        (ke ta commit ghofl mimune) akharin ghofl transaction ast, baad az hame otagh ha.
+        """
+        if _pending_changes.get() is not None:
+            yield #block birooni zakhire mikone
+            return
+        occupancy, held = Counter(), Counter()
+        token = _pending_changes.set((occupancy, held))
+        try:
+            yield
+        finally:
+            _pending_changes.reset(token)
+        cls.apply(occupancy=dict(occupancy), held=dict(held))
+
+    @classmethod
+    def apply(cls, occupancy=None, held=None):
+        #taghir tedad sakenin / hold ha; har do ba ham dar yek UPDATE
+        occupancy = occupancy or {}
+        held = held or {}
+        pending = _pending_changes.get()
+        if pending is not None:
+            pending[0].update(occupancy)
+            pending[1].update(held)
+            return
+        occupancy = {pk: delta for pk, delta in occupancy.items() if delta}
+        held = {pk: delta for pk, delta in held.items() if delta}
+        room_ids = set(occupancy) | set(held)
+        if not room_ids:
+            return
+        occupancy_delta = _delta_case(occupancy)
+        #savepoint lazem nist: khata dar har soorat transaction birooni ro rollback mikone
+        with transaction.atomic(savepoint=False):
+            cls._bump_version()
+            cls.objects.filter(room_id__in=room_ids).update(
+                occupancy=F('occupancy') + occupancy_delta,
+                free_slots=F('free_slots') - occupancy_delta - _delta_case(held),
+                #version jadid dar khode UPDATE khunde mishe (bedoon SELECT joda)
+                version=Subquery(AvailabilityVersion.objects.filter(pk=1).values('value')),
+                updated_at=timezone.now(),
+            )
+
+    @classmethod
+    def refresh(cls, rooms=None):
+        #satr haye in otagh ha az rooye Room / Block / Dorm dobare sakhte mishan (None: hame)
+        if rooms is None:
+            rooms = Room.objects.all()
+        with transaction.atomic():
+            rows = list(
+                rooms.select_for_update()
+                .order_by('pk')
+                .values_list(
+                    'pk', 'placed_in__placed_in_id', 'placed_in_id', 'placed_in__placed_in__name', 'placed_in__name',
+                    'number', 'floor_number', 'room_cost', 'capacity', 'current_occupancy', 'held_count',
+                    'is_active', 'placed_in__is_active', 'placed_in__placed_in__is_active',
+                )
+            )
+            #version baad az ghofl otagh ha (mesl take_slot): tartib ghofl ha hamishe otagh -> counter
+            version = cls.next_version()
+            updated_at = timezone.now()
+            objs = [
+                cls(
+                    room_id=pk, dorm_id=dorm_id, block_id=block_id, dorm_name=dorm_name, block_name=block_name,
+                    number=number, floor_number=floor_number, room_cost=room_cost, capacity=capacity,
+                    occupancy=occupancy, free_slots=capacity - occupancy - held,
+                    is_listed=room_active and block_active and dorm_active,
+                    version=version, updated_at=updated_at,
+                )
+                for (pk, dorm_id, block_id, dorm_name, block_name, number, floor_number, room_cost, capacity,
+                     occupancy, held, room_active, block_active, dorm_active) in rows
+            ]
+            cls.objects.filter(room__in=rooms.values('pk')).delete()
+            cls.objects.bulk_create(objs, batch_size=cls.REFRESH_BATCH_SIZE)
+        return len(objs)
+
+    @classmethod
+    def current_version(cls):
+        #faghat version haye commit shode
+        with primary():
+            return AvailabilityVersion.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+    @classmethod
+    def next_version(cls):
+        with transaction.atomic(savepoint=False):
+            cls._bump_version()
+            return AvailabilityVersion.objects.filter(pk=1).values_list('value', flat=True).get()
+
+    @classmethod
+    def _bump_version(cls):
+        #ghofl satr counter ta commit transaction birooni mimune
+        if not AvailabilityVersion.objects.filter(pk=1).update(value=F('value') + 1):
+            #satr counter nist (DB khali / flush shode): az bozorgtarin version edame midim
+            AvailabilityVersion.objects.get_or_create(pk=1, defaults={
+                'value': cls.objects.aggregate(v=Coalesce(Max('version'), 0))['v'],
+            })
+            AvailabilityVersion.objects.filter(pk=1).update(value=F('value') + 1)
+
+    @classmethod
+    def scope_state(cls, dorm_id=None, block_id=None, floor=None, refresh=False):
+        #(akharin version, tedad otagh, akharin zaman taghir, zoodtarin payan hold) otagh haye yek filter;
+        # cache ta version commit shode baadi. tedad: hazf otagh version jadid nemisaze vali ETag ro avaz mikone
+        key = f"webdorm:availability_scope:{cls.current_version()}:{dorm_id}:{block_id}:{floor}"
+        state = None if refresh else cache.get(key)
+        if state is None:
+            with primary():
+                rooms = cls.in_scope(cls.objects.all(), dorm_id, block_id, floor)
+                state = rooms.aggregate(
+                    version=Coalesce(Max('version'), 0),
+                    count=Count('pk'),
+                    updated_at=Max('updated_at'),
+                )
+                holds = RoomHold.objects.all()
+                if (dorm_id, block_id, floor) != (None, None, None):
+                    holds = holds.filter(room_id__in=rooms.values('pk'))
+                next_expiry = holds.aggregate(next_expiry=Min('expires_at'))['next_expiry']
+            state = (state['version'], state['count'], state['updated_at'], next_expiry)
+            cache.set(key, state, cls.SCOPE_CACHE_TIMEOUT)
+        return state
+
+    @staticmethod
+    def in_scope(queryset, dorm_id=None, block_id=None, floor=None):
+        if dorm_id is not None: queryset = queryset.filter(dorm_id=dorm_id)
+        if block_id is not None: queryset = queryset.filter(block_id=block_id)
+        if floor is not None: queryset = queryset.filter(floor_number=floor)
+        return queryset
+
+    class Meta:
+        verbose_name = "ظرفیت خالی اتاق"
+        verbose_name_plural = "ظرفیت خالی اتاق ها"
+        indexes = [
+            #list safhe entekhab otagh: filter (khabgah / block / tabaghe) + sort ha.
+            # is_listed too index nist (boolean, taghriban hame satr ha true) va baad az index check mishe
+            models.Index(fields=['number'], name='avail_number_idx'),
+            models.Index(fields=['dorm', 'floor_number', 'number'], name='avail_dorm_floor_idx'),
+            models.Index(fields=['block', 'floor_number', 'number'], name='avail_block_floor_idx'),
+            models.Index(fields=['floor_number', 'number'], name='avail_floor_idx'),
+            models.Index(fields=['room_cost', 'number'], name='avail_cost_idx'),
+            models.Index(fields=['-room_cost', 'number'], name='avail_cost_desc_idx'),
+            models.Index(fields=['free_slots', 'number'], name='avail_free_idx'),
+            models.Index(fields=['-free_slots', 'number'], name='avail_free_desc_idx'),
+            #ETag / delta (scope_state, ?since=)
+            models.Index(fields=['dorm', 'version'], name='avail_dorm_version_idx'),
+            models.Index(fields=['block', 'version'], name='avail_block_version_idx'),
+            models.Index(fields=['version'], name='avail_version_idx'),
+        ]
+
+class RoomHold(models.Model):
+    #rezerv movaghat yek ja dar otagh ta daneshjoo entekhab ro tayid kone
+    user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name='دانشجو', related_name='room_hold')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, verbose_name='اتاق', related_name='holds')
+    expires_at = models.DateTimeField(verbose_name='زمان پایان رزرو موقت', db_index=True)
+
+    DURATION = timedelta(minutes=5)
+    SWEEP_BATCH_SIZE = 2000
+
+    def __str__(self):
+        return f"رزرو موقت {self.room_id} برای {self.user_id}"
+
+    @property
+    def is_active(self):
+        return self.expires_at > timezone.now()
+
+    @classmethod
+    def place(cls, user, room):
+        #hold jadid ya tamdid hold feli; agar otagh ja nadashte bashe None
+        with transaction.atomic(), RoomAvailability.batch():
+            #ghofl rooye satr daneshjoo: do request hamzaman yek daneshjoo do hold nemisazan
+            list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+            hold = cls.objects.filter(user=user).first()
+            Room.lock({room.pk, hold.room_id if hold is not None else None})
+            if cls.release_expired(room_ids=[room.pk]):
+                hold = cls.objects.filter(user=user).first()
+            expires_at = timezone.now() + cls.DURATION
+
+            if hold is not None and hold.room_id == room.pk:
+                hold.expires_at = expires_at
+                hold.save(update_fields=['expires_at'])
+                return hold
+
+            if not Room.take_hold_slot(room.pk):
+                return None
+            if hold is not None:
+                cls.release(hold)
+            return cls.objects.create(user=user, room=room, expires_at=expires_at)
+
+    @classmethod
+    def expired_counts(cls, room_ids):
+        #hold haye monghazi ke sweep (release_expired_holds) hanooz pak nakarde: free_slots hanooz por hesabeshon mikone
+        return dict(
+            cls.objects.filter(room_id__in=room_ids, expires_at__lte=timezone.now())
+            .values('room_id').annotate(count=Count('pk')).values_list('room_id', 'count')
+        )
+
+    @classmethod
+    def release(cls, hold):
+        with transaction.atomic(), RoomAvailability.batch():
+            Room.lock([hold.room_id])
+            if cls.objects.filter(pk=hold.pk).delete()[0]:
+                Room.release_hold_slot(hold.room_id)
+
+    @classmethod
+    def release_expired(cls, room_ids=None):
+        #set-based: har batch yek DELETE va yek UPDATE rooye otagh ha (ba Case bar asas tedad)
+        now = timezone.now()
+        released = 0
+        while True:
+            expired = cls.objects.filter(expires_at__lte=now)
+            if room_ids is not None:
+                expired = expired.filter(room_id__in=room_ids)
+            #aval bedoon ghofl peyda mishan; ghofl otagh ha ghabl az hold ha (tartib Room.lock)
+            candidates = list(expired.order_by('pk').values_list('pk', 'room_id')[:cls.SWEEP_BATCH_SIZE])
+            if not candidates:
+                break
+            with transaction.atomic(), RoomAvailability.batch():
+                Room.lock({room_id for _, room_id in candidates})
+                #hold haye ke hamzaman tabdil / azad shodan kenar gozashte mishan
+                batch = list(
+                    cls.objects.select_for_update()
+                    .filter(pk__in=[pk for pk, _ in candidates], expires_at__lte=now)
+                    .values_list('pk', 'room_id')
+                )
+                if batch:
+                    per_room = Counter(room_id for _, room_id in batch)
+                    rooms_by_count = defaultdict(list)
+                    for room_id, count in per_room.items():
+                        rooms_by_count[count].append(room_id)
+
+                    cls.objects.filter(pk__in=[pk for pk, _ in batch]).delete()
+                    Room.objects.filter(pk__in=per_room).update(
+                        held_count=F('held_count') - Case(
+                            *[When(pk__in=ids, then=Value(count)) for count, ids in rooms_by_count.items()],
+                            default=Value(0),
+                        )
+                    )
+                    RoomAvailability.apply(held={room_id: -count for room_id, count in per_room.items()})
+            released += len(batch)
+            if len(candidates) < cls.SWEEP_BATCH_SIZE:
+                break
+        return released
+
+    class Meta:
+        verbose_name = "رزرو موقت"
+        verbose_name_plural = "رزروهای موقت"
+        indexes = [
+            models.Index(fields=['room', 'expires_at'], name='hold_room_expires_idx'),
+        ]
+
 
 class Notice(models.Model):
     title = models.CharField(max_length=128,verbose_name='عنوان')
     text = models.TextField(verbose_name='متن')
     date_modified = models.DateField(verbose_name='زمان بارگذاری',auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='زمان آخرین ویرایش', auto_now=True)
 
     def __str__(self):
         return f"اطلاعیه {self.title}"
+
+    FEED_CACHE_KEY = 'webdorm:notice_feed'
+    FEED_CACHE_TIMEOUT = 3600
+    #ba cache mahali (LocMem) pak kardan faghat worker feli ro pak mikone; baghie ta in zaman noskhe ghadimi daran
+    FEED_STATE_TIMEOUT = 30
+    FEED_PER_PAGE = 10
+
+    @classmethod
+    def feed_state(cls):
+        #noskhe feed: token ba har save / delete avaz mishe (ETag va kelid cache html)
+        return get_cached(cls.FEED_CACHE_KEY, cls._load_feed_state, cls.FEED_STATE_TIMEOUT)
+
+    @classmethod
+    def _load_feed_state(cls):
+        #token az khode dade (tedad + akharin pk + akharin virayesh): hame worker ha baraye yek dade token yeksan daran
+        state = cls.objects.aggregate(count=Count('pk'), last_pk=Max('pk'), built_at=Max('updated_at'))
+        token = hashlib.md5(f"{state['count']}:{state['last_pk']}:{state['built_at']}".encode()).hexdigest()[:16]
+        return {'token': token, 'built_at': state['built_at'] or datetime.fromtimestamp(0, dt_timezone.utc)}
+
+    @classmethod
+    def clear_feed_cache(cls):
+        clear_cached(cls.FEED_CACHE_KEY)
     
     class Meta:
         verbose_name = "اطلاعیه"
@@ -0,0 +1,99 @@
+import base64
+import binascii
+import json
+from django.db.models import Q
+
+
+class KeysetPage:
+    #jaygozin-e Page-e Paginator baraye safhe bandi cursor-i (bedoon COUNT va OFFSET)
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    #cursor kharab ya motaalegh be sort dige -> None (safhe aval)
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return None
+    return values
+
+
+def _parse_ordering(ordering):
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def _seek_filter(keys, values, forward):
+    # (a, b, c) > (x, y, z)  ==>  a > x  OR  (a = x AND b > y)  OR  (a = x AND b = y AND c > z)
+    condition = None
+    equal_prefix = Q()
+    for (name, descending), value in zip(keys, values):
+        lookup = 'lt' if descending == forward else 'gt'
+        term = equal_prefix & Q(**{f"{name}__{lookup}": value})
+        condition = term if condition is None else condition | term
+        equal_prefix &= Q(**{name: value})
+    return condition
+
+
+def keyset_paginate(queryset, ordering, per_page, after=None, before=None):
+    """
+    ordering bayad ye kelid yekta dashte bashe (mesalan 'pk' dar akhar) ta cursor ha sabet bashan.
+    hazine har safhe mostaghel az shomare safhe ast: ye WHERE rooye tuple sort + LIMIT per_page + 1.
+    """
+    keys = _parse_ordering(ordering)
+    after_values = decode_cursor(after, len(keys))
+    before_values = decode_cursor(before, len(keys)) if after_values is None else None
+
+    if before_values is not None:
+        reverse_ordering = [name if descending else f"-{name}" for name, descending in keys]
+        rows = list(queryset.filter(_seek_filter(keys, before_values, forward=False)).order_by(*reverse_ordering)[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        qs = queryset.order_by(*ordering)
+        if after_values is not None:
+            qs = qs.filter(_seek_filter(keys, after_values, forward=True))
+        rows = list(qs[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after_values is not None
+
+    def cursor_of(obj):
+        return encode_cursor([getattr(obj, name) for name, _ in keys])
+
+    return KeysetPage(
+        rows,
+        has_next=has_next and bool(rows),
+        has_previous=has_previous and bool(rows),
+        next_cursor=cursor_of(rows[-1]) if rows else None,
+        previous_cursor=cursor_of(rows[0]) if rows else None,
+    )
@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models import Q
+from .forms import fix_numbers
+from .models import User
+
+# tatbigh file vahed pardakht ba User.payed_cost: satr ha ba student_code / national_code peyda mishan
+# (ba fix_numbers), taghirat ba UPDATE haye dasteyi zakhire mishan va gozaresh ekhtelaf sakhte mishe.
+# sotoon ekhtiari paid: khali / 1 / yes / بله = pardakht shode, 0 / no / خیر = pardakht nashode
+
+PAID_VALUES = {'', '1', 'true', 'yes', 'y', 'paid', 'بله', 'پرداخت شده'}
+UNPAID_VALUES = {'0', 'false', 'no', 'n', 'unpaid', 'خیر', 'پرداخت نشده'}
+
+
+class ReconciliationReport:
+    def __init__(self):
+        self.marked_paid = [] #shomare daneshjoyi
+        self.marked_unpaid = []
+        self.unchanged = 0
+        self.unmatched = [] #(shomare satr, code)
+        self.problems = [] #(shomare satr, tozih)
+        self.paid_not_in_file = [] #dar system pardakht shode vali dar file nist (faghat gozaresh)
+        self.dry_run = False
+
+    def summary_lines(self):
+        lines = [
+            f"{len(self.marked_paid)} دانشجو پرداخت‌کرده و {len(self.marked_unpaid)} دانشجو پرداخت‌نکرده ثبت شد، {self.unchanged} بدون تغییر",
+            f"{len(self.unmatched)} سطر با هیچ دانشجویی مطابقت نداشت، {len(self.problems)} سطر مشکل دار",
+            f"{len(self.paid_not_in_file)} دانشجوی پرداخت‌کرده در فایل نیست",
+        ]
+        if self.dry_run:
+            lines.append("پیش‌نمایش: هیچ تغییری ذخیره نشد")
+        return lines
+
+
+def _parse_paid(value):
+    value = fix_numbers(value).lower()
+    if value in PAID_VALUES:
+        return True
+    if value in UNPAID_VALUES:
+        return False
+    return None
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reconcile_payments(rows, dry_run=False, batch_size=1000):
+    """
+    rows: (shomare satr, dict) mesl spreadsheets.iter_rows.
+    har dasteh: yek SELECT baraye peyda kardan daneshjoo ha + har vaziat yek UPDATE (na save tak tak).
+    """
+    report = ReconciliationReport()
+    report.dry_run = dry_run
+    seen = {} #user pk -> (shomare satr, paid)
+
+    with transaction.atomic():
+        for batch in _batches(rows, batch_size):
+            parsed = []
+            for line_number, row in batch:
+                student_code = fix_numbers(row.get('student_code', ''))
+                national_code = fix_numbers(row.get('national_code', ''))
+                paid = _parse_paid(row.get('paid', ''))
+                if not student_code and not national_code:
+                    report.problems.append((line_number, "شماره دانشجویی و کد ملی خالی است"))
+                elif paid is None:
+                    report.problems.append((line_number, f"مقدار ستون paid نامعتبر است: «{row.get('paid')}»"))
+                else:
+                    parsed.append((line_number, student_code, national_code, paid))
+
+            by_student_code = {}
+            by_national_code = {}
+            for user in User.objects.filter(
+                Q(student_code__in={row[1] for row in parsed if row[1]})
+                | Q(national_code__in={row[2] for row in parsed if row[2]})
+            ).values_list('pk', 'student_code', 'national_code', 'payed_cost'):
+                by_student_code[user[1]] = user
+                by_national_code[user[2]] = user
+
+            to_paid, to_unpaid = [], []
+            for line_number, student_code, national_code, paid in parsed:
+                user = by_student_code.get(student_code) or by_national_code.get(national_code)
+                if user is None:
+                    report.unmatched.append((line_number, student_code or national_code))
+                    continue
+                pk, user_student_code, user_national_code, payed_cost = user
+                if (student_code and student_code != user_student_code) or (national_code and national_code != user_national_code):
+                    report.problems.append((line_number, f"شماره دانشجویی {student_code} و کد ملی {national_code} مربوط به دو دانشجوی متفاوت است"))
+                    continue
+                if pk in seen:
+                    if seen[pk][1] != paid:
+                        report.problems.append((line_number, f"با سطر {seen[pk][0]} برای دانشجو {user_student_code} تناقض دارد"))
+                    continue
+                seen[pk] = (line_number, paid)
+                if paid == payed_cost:
+                    report.unchanged += 1
+                elif paid:
+                    to_paid.append(pk)
+                    report.marked_paid.append(user_student_code)
+                else:
+                    to_unpaid.append(pk)
+                    report.marked_unpaid.append(user_student_code)
+
+            if not dry_run:
+                if to_paid:
+                    User.objects.filter(pk__in=to_paid).update(payed_cost=True)
+                if to_unpaid:
+                    User.objects.filter(pk__in=to_unpaid).update(payed_cost=False)
+
+        in_file = set(seen)
+        report.paid_not_in_file = [
+            code for pk, code in
+            User.objects.filter(payed_cost=True, is_staff=False).values_list('pk', 'student_code')
+            if pk not in in_file
+        ]
+    return report
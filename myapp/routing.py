@@ -0,0 +1,76 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# khundan haye safhe haye faghat-khundani daneshjoo va changelist admin az replica (REPLICA_DATABASES).
+# hame neveshtan ha, har chizi dakhel transaction (select_for_update, hold, rezerv) va por kardan cache ha
+# rooye primary. baad az rezerv / taghir admin, karbar REPLICA_STICKY_SECONDS rooye primary mimune
+# (read-your-writes) ta agar replica aghab bashe taghir khodesh ro bebine.
+
+PIN_SESSION_KEY = '_webdorm_primary_until'
+
+_read_alias = ContextVar('webdorm_read_alias', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #replica ha hamoon dade primary ro daran
+        return True
+
+
+@contextmanager
+def primary():
+    #baraye por kardan cache: dade cache shode nabayad az replica aghab oftade bashe
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_to_primary(request):
+    if settings.REPLICA_DATABASES:
+        request.session[PIN_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+
+
+def read_alias_for(request):
+    #alias khundan baraye in request: replica tasadofi, ya primary agar replica nadarim / karbar pin shode
+    if not settings.REPLICA_DATABASES or request.method not in ('GET', 'HEAD'):
+        return DEFAULT_DB_ALIAS
+    if request.session.get(PIN_SESSION_KEY, 0) > time.time():
+        return DEFAULT_DB_ALIAS
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+def replica_reads(view):
+    """
+    view (sync) ba khundan az replica. bad az login_required bezarid ta session / user az primary khunde beshan.
+    TemplateResponse ham dakhel hamin block render mishe (query haye changelist moghe render ejra mishan).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = read_alias_for(request)
+        if alias == DEFAULT_DB_ALIAS:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            return response
+        finally:
+            _read_alias.reset(token)
+    return wrapper
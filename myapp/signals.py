@@ -0,0 +1,98 @@
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import User, Dorm, Block, Room, RoomAvailability, RoomHold, OtherInfo, SelectionCohort, Notice
+from .deferred_writes import defer_last_login, flush_if_due
+
+
+@receiver(post_delete, sender=User)
+def release_room_on_user_delete(sender, instance, **kwargs):
+    #vaghti daneshjoo hazf mishe jash dar otagh azad mishe
+    if instance.placed_in_id is not None:
+        Room.release_slot(instance.placed_in_id)
+
+
+@receiver(pre_delete, sender=User)
+def release_hold_on_user_delete(sender, instance, **kwargs):
+    #hold ba CASCADE pak mishe va held_count kam nemishe; pas ghablesh azadesh mikonim
+    hold = RoomHold.objects.filter(user=instance).first()
+    if hold is not None:
+        RoomHold.release(hold)
+
+
+@receiver(post_save, sender=OtherInfo)
+@receiver(post_delete, sender=OtherInfo)
+@receiver(post_save, sender=SelectionCohort)
+@receiver(post_delete, sender=SelectionCohort)
+def clear_selection_window_cache(sender, **kwargs):
+    #ham alan ham bad az commit (ta request haye hamzaman noskhe ghadimi ro dobare cache nakonan)
+    sender.clear_cache()
+    transaction.on_commit(sender.clear_cache)
+
+
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def clear_floor_filter_cache(sender, **kwargs):
+    #otagh haye block ba bulk_create sakhte mishan (signal nadaran) pas az rooye block ham pak mikonim;
+    # otagh tak (admin) tabaghe ash ro avaz kone ya hazf beshe
+    cache.delete(Room.FLOORS_CACHE_KEY)
+
+
+@receiver(post_save, sender=Dorm)
+@receiver(post_delete, sender=Dorm)
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def clear_room_filter_cache(sender, **kwargs):
+    Dorm.clear_filter_cache()
+    transaction.on_commit(Dorm.clear_filter_cache)
+
+
+@receiver(post_save, sender=Notice)
+@receiver(post_delete, sender=Notice)
+def clear_notice_feed_cache(sender, **kwargs):
+    Notice.clear_feed_cache()
+    transaction.on_commit(Notice.clear_feed_cache)
+
+
+@receiver(post_save, sender=Room)
+def refresh_room_availability(sender, instance, **kwargs):
+    RoomAvailability.refresh(Room.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Room)
+def bump_availability_version(sender, **kwargs):
+    #satr RoomAvailability ba CASCADE pak shode; version jadid ta ETag / scope_state dobare hesab beshe
+    RoomAvailability.next_version()
+
+
+@receiver(post_save, sender=Block)
+def refresh_block_availability(sender, instance, created, **kwargs):
+    #esm / faal boodan block dar satr haye otagh hash tekrar shode
+    if not created:
+        RoomAvailability.refresh(Room.objects.filter(placed_in=instance))
+
+
+@receiver(post_save, sender=Dorm)
+def refresh_dorm_availability(sender, instance, created, **kwargs):
+    if not created:
+        RoomAvailability.refresh(Room.objects.filter(placed_in__placed_in=instance))
+
+
+#last_login dar login-e hamzaman hezaran daneshjoo: bejaye save be ezaye har login, gorohi zakhire mishe
+user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+
+
+@receiver(user_logged_in, dispatch_uid='deferred_update_last_login')
+def deferred_update_last_login(sender, user, **kwargs):
+    user.last_login = timezone.now()
+    defer_last_login(user.pk, user.last_login)
+
+
+request_finished.connect(flush_if_due, dispatch_uid='flush_deferred_last_login')
@@ -0,0 +1,180 @@
+import csv
+import io
+import re
+import zipfile
+from itertools import chain
+from xml.sax.saxutils import escape
+
+# khundan satr be satr CSV / XLSX bedoon load kardan kol file dar hafeze.
+# openpyxl faghat baraye khundan xlsx lazem ast (optional); neveshtan xlsx ba zipfile khode python.
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def _iter_csv(file):
+    if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+        with open(file, newline='', encoding='utf-8-sig') as f:
+            yield from csv.reader(f)
+        return
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='') if 'b' in getattr(file, 'mode', 'b') else file
+    yield from csv.reader(text)
+
+
+def _iter_xlsx(file):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValueError("برای خواندن فایل xlsx بسته openpyxl باید نصب باشد.")
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException):
+        #file kharab ya xlsx nist (masalan csv ba pasvand xlsx)
+        raise ValueError("فایل xlsx معتبر نیست یا خراب است.")
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if cell is None else str(cell) for cell in row]
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename=None):
+    """
+    (shomare satr, dict) barmigardune; kelid ha esm sotoon haye satr aval (lowercase).
+    file mitune masir ya file baz shode (mesl UploadedFile) bashe.
+    """
+    name = str(filename or getattr(file, 'name', file)).lower()
+    rows = _iter_xlsx(file) if name.endswith('.xlsx') else _iter_csv(file)
+
+    header = None
+    for line_number, row in enumerate(rows, start=1):
+        if header is None:
+            header = [_normalize_header(cell) for cell in row]
+            continue
+        if not any(str(cell).strip() for cell in row):
+            continue
+        yield line_number, dict(zip(header, (str(cell).strip() for cell in row)))
+
+
+# --- neveshtan (export) ---
+# har do generator tekke haye bytes midan: ghabl az khundan satr aval header ersal mishe
+# va hafeze mostaghel az tedad satr hast.
+
+FLUSH_BYTES = 64 * 1024
+
+
+#matn vared shode tavasot daneshjoo (esm / email) ke ba in ha shoroo beshe dar Excel formula hesab mishe (=HYPERLINK(...))
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'بله' if value else 'خیر'
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return str(value)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    #BOM baraye Excel (farsi dorost neshoon dade beshe)
+    writer = csv.writer(_Echo())
+    yield ('\ufeff' + writer.writerow(header)).encode()
+    lines = []
+    size = 0
+    for row in rows:
+        line = writer.writerow([_cell_text(value) for value in row])
+        lines.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(lines).encode()
+            lines, size = [], 0
+    if lines:
+        yield ''.join(lines).encode()
+
+
+class _ChunkBuffer:
+    #khorooji zipfile; zipfile bedoon seek ham minevise (data descriptor)
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+_XLSX_PARTS = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="export" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+     '</Relationships>'),
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', _cell_text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def iter_xlsx(header, rows):
+    #sheet ba inlineStr (bedoon sharedStrings ke bayad kol dade ro negah dare)
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS:
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(_SHEET_HEAD.encode())
+            yield buffer.drain()
+            for row in chain([header], rows):
+                sheet.write(('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>').encode())
+                if buffer.size >= FLUSH_BYTES:
+                    yield buffer.drain()
+            sheet.write(_SHEET_TAIL.encode())
+    yield buffer.drain()
@@ -1,3 +1,1163 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.admin import helpers
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.db.models.query import QuerySet
+from django.http import QueryDict
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, set_script_prefix
+from django.utils import timezone
+from django.utils.html import escapejs
+from . import hashing
+from .allocation import allocate_students
+from .backends import _save_upgraded_password
+from .caching import LOCAL_TIMEOUT, _local_copies
+from .models import User, Dorm, Block, Room, RoomAvailability, RoomHold, OtherInfo, SelectionCohort, Notice
+from .exports import iter_export_rows
+from .spreadsheets import iter_csv, iter_xlsx
+from .routing import PIN_SESSION_KEY, pin_to_primary, primary, replica_reads
+from .pagination import encode_cursor
+from .views import listing_ordering, listing_page
 
-# Create your tests here.
+
+def seed_campus(dorms, blocks_per_dorm, floors, rooms_per_floor, students):
+    #otagh ha ba Block.save (create_rooms_automatically) sakhte mishan, daneshjoo ha ba bulk_create
+    for d in range(dorms):
+        dorm = Dorm.objects.create(name=f"dorm {d}", gender='male')
+        for b in range(blocks_per_dorm):
+            Block.objects.create(
+                name=f"block {b}", placed_in=dorm, floor_count=floors,
+                floor_rooms=rooms_per_floor, room_costs=1000 + b,
+            )
+
+    room_ids = list(Room.objects.values_list('pk', flat=True))
+    User.objects.bulk_create(
+        (
+            User(
+                username=f"s{i}", student_code=f"{i:09d}", national_code=f"{i:010d}",
+                first_name="name", last_name="family", password='!',
+                payed_cost=True, placed_in_id=room_ids[i % len(room_ids)],
+            )
+            for i in range(students)
+        ),
+        batch_size=2000,
+    )
+    per_room, extra = divmod(students, len(room_ids))
+    Room.objects.update(current_occupancy=per_room)
+    Room.objects.filter(pk__in=room_ids[:extra]).update(current_occupancy=per_room + 1)
+    RoomAvailability.refresh()
+
+
+class QueryBudgetMixin:
+    def setUp(self):
+        super().setUp()
+        #FORCE_SCRIPT_NAME (/webdorm) faghat baraye server asli ast
+        set_script_prefix('/')
+        #cache sard: budget bayad badtarin halat (avalin request) ro ham pooshesh bede
+        cache.clear()
+        _local_copies.clear()
+        #flush zamani last_login (request_finished) tedad query ha ro be zaman vabaste mikone
+        patcher = mock.patch('myapp.deferred_writes.FLUSH_INTERVAL', float('inf'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertQueryBudget(self, url, budget, status=200, method='get', data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, status, url)
+        if len(queries) > budget:
+            self.fail(f"{url}: {len(queries)} queries (budget {budget})\n{query_report(queries.captured_queries)}")
+        return response
+
+
+def query_report(captured):
+    #query haye tekrari (N+1) ba adad haye hazf shode goroh bandi mishan
+    shapes = Counter(re.sub(r"\b\d+\b|'[^']*'", '?', q['sql']) for q in captured)
+    lines = [f"{i}. {q['sql']}" for i, q in enumerate(captured, 1)]
+    repeated = [f"  x{count}: {sql}" for sql, count in shapes.most_common() if count > 1]
+    if repeated:
+        lines += ["repeated:"] + repeated
+    return "\n".join(lines)
+
+
+class QueryBudgetCases(QueryBudgetMixin):
+    #hamin budget ha baraye har do andaze campus; agar ba dade bishtar query ezafe beshe N+1 darim
+    CAMPUS = None
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(**cls.CAMPUS)
+        now = timezone.now()
+        OtherInfo.objects.create(start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1))
+        SelectionCohort.objects.create(
+            name="sal 99", kind=SelectionCohort.KindChoices.entry_year, value='000',
+            start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1),
+        )
+        Notice.objects.bulk_create(Notice(title=f"notice {i}", text="text") for i in range(20))
+        cls.admin_user = User.objects.create_superuser(
+            username='admin', student_code='admin', national_code='admin', password='!',
+        )
+        cls.dorm = Dorm.objects.first()
+        cls.block = Block.objects.first()
+        cls.room = Room.objects.filter(placed_in=cls.block).first()
+        cls.student = User.objects.filter(placed_in=cls.room).first()
+        cls.other_room = Room.objects.filter(placed_in=cls.block).exclude(pk=cls.room.pk).last()
+
+    def test_student_views(self):
+        self.client.force_login(self.student)
+        self.assertQueryBudget(reverse('dashboard_'), 4)
+        self.assertQueryBudget(reverse('select_room_'), 7)
+        self.assertQueryBudget(reverse('select_room_') + f"?dorm={self.dorm.pk}&floor=2&price_sort=cheap", 7)
+        self.assertQueryBudget(reverse('view_room_', args=[self.other_room.pk]), 15)
+        self.assertQueryBudget(reverse('my_room_'), 4)
+        self.assertQueryBudget(reverse('profile_'), 3)
+
+    def test_book_room(self):
+        self.client.force_login(self.student)
+        self.assertQueryBudget(reverse('book_room_action', args=[self.other_room.pk]), 18, status=302)
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.placed_in_id, self.other_room.pk)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin_user)
+        room_url = reverse('webdorm_admin:myapp_room_changelist')
+        user_url = reverse('webdorm_admin:myapp_user_changelist')
+        self.assertQueryBudget(room_url, 10)
+        self.assertQueryBudget(f"{room_url}?placed_in__placed_in__id__exact={self.dorm.pk}&floor=3&o=6", 10)
+        self.assertQueryBudget(user_url, 10)
+        self.assertQueryBudget(f"{user_url}?placed_in__placed_in__id__exact={self.block.pk}&payed_cost__exact=1", 10)
+        self.assertQueryBudget(reverse('webdorm_admin:myapp_dorm_changelist'), 8)
+        self.assertQueryBudget(reverse('webdorm_admin:myapp_block_changelist') + "?o=4", 8)
+        self.assertQueryBudget(reverse('webdorm_admin:myapp_notice_changelist'), 8)
+        self.assertQueryBudget(reverse('webdorm_admin:myapp_otherinfo_changelist'), 8)
+        self.assertQueryBudget(reverse('webdorm_admin:myapp_selectioncohort_changelist'), 8)
+        self.assertQueryBudget(reverse('webdorm_admin:myapp_selectioncohort_preview'), 8)
+
+    def test_admin_change_forms(self):
+        self.client.force_login(self.admin_user)
+        for name, pk, budget in (
+            ('user', self.student.pk, 10),
+            ('room', self.room.pk, 8),
+            ('block', self.block.pk, 8),
+            ('dorm', self.dorm.pk, 8),
+            ('notice', Notice.objects.first().pk, 8),
+            ('otherinfo', 1, 8),
+            ('selectioncohort', SelectionCohort.objects.first().pk, 8),
+        ):
+            with self.subTest(model=name):
+                self.assertQueryBudget(reverse(f'webdorm_admin:myapp_{name}_change', args=[pk]), budget)
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class SmallCampusQueryBudgetTests(QueryBudgetCases, TestCase):
+    CAMPUS = dict(dorms=1, blocks_per_dorm=2, floors=2, rooms_per_floor=5, students=40)
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class LargeCampusQueryBudgetTests(QueryBudgetCases, TestCase):
+    #10k otagh / 50k daneshjoo
+    CAMPUS = dict(dorms=10, blocks_per_dorm=10, floors=10, rooms_per_floor=10, students=50000)
+
+
+#jadval haye bozorg: scan kamel rooye inha = regression
+HOT_TABLES = ('myapp_user', 'myapp_room', 'myapp_roomavailability', 'myapp_roomhold')
+
+
+def full_scans(sql):
+    """jadval haye bozorgi ke query rooshoon scan kamel mikone (SQLite / MySQL)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            #"SCAN myapp_room" scan kamel ast; "SCAN ... USING INDEX" / "SEARCH ..." na
+            return [
+                match.group(1) for row in cursor.fetchall()
+                if (match := re.fullmatch(r'SCAN (\w+)(?: AS \w+)?', row[-1])) and match.group(1) in HOT_TABLES
+            ]
+        if connection.vendor == 'mysql':
+            cursor.execute(f"EXPLAIN {sql}")
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [row['table'] for row in rows if row['type'] == 'ALL' and row['table'] in HOT_TABLES]
+    return []
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=2, blocks_per_dorm=2, floors=3, rooms_per_floor=4, students=100)
+        cls.dorm = Dorm.objects.first()
+        cls.block = Block.objects.first()
+        cls.room = Room.objects.first()
+        cls.student = User.objects.filter(placed_in=cls.room).first()
+
+    def assertIndexed(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            scans = full_scans(sql)
+            self.assertFalse(scans, f"full scan on {', '.join(scans)}:\n{sql}")
+
+    def test_room_listing(self):
+        for params in (
+            f"dorm={self.dorm.pk}",
+            f"dorm={self.dorm.pk}&floor=2",
+            f"block={self.block.pk}&floor=1&price_sort=cheap",
+            "capacity_sort=empty",
+            "price_sort=expensive",
+            "floor=3",
+        ):
+            with self.subTest(params=params):
+                self.assertIndexed(lambda: listing_page(QueryDict(params)))
+
+    def test_availability_versions(self):
+        self.assertIndexed(lambda: RoomAvailability.scope_state(self.dorm.pk, None, None))
+        self.assertIndexed(lambda: RoomAvailability.scope_state(None, self.block.pk, 2))
+        self.assertIndexed(lambda: list(RoomAvailability.objects.filter(block=self.block, version__gt=0)))
+
+    def test_room_admin_filters(self):
+        self.assertIndexed(lambda: list(Room.objects.filter(is_active=True, placed_in=self.block, floor_number=2)))
+        self.assertIndexed(lambda: list(Room.objects.filter(placed_in=self.block).order_by('floor_number', 'number')))
+        self.assertIndexed(Room.floor_numbers)
+
+    def test_roommates_and_allocation(self):
+        self.assertIndexed(lambda: list(self.room.students.exclude(pk=self.student.pk)))
+        self.assertIndexed(lambda: list(User.objects.filter(payed_cost=True, placed_in__isnull=True)))
+        self.assertIndexed(lambda: RoomHold.release_expired(room_ids=[self.room.pk]))
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class StreamingExportTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=2, blocks_per_dorm=2, floors=2, rooms_per_floor=5, students=150)
+        User.objects.filter(pk__in=User.objects.order_by('pk').values('pk')[:10]).update(payed_cost=False)
+        cls.admin_user = User.objects.create_superuser(
+            username='admin', student_code='admin', national_code='admin', password='!',
+        )
+        cls.dorm = Dorm.objects.first()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin_user)
+
+    def export(self, model, file_format, query=''):
+        response = self.client.get(reverse(f'webdorm_admin:myapp_{model}_export', args=[file_format]) + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_placements_csv_uses_changelist_filters(self):
+        body = self.export('user', 'csv', f"?placed_in__placed_in__placed_in__id__exact={self.dorm.pk}&payed_cost__exact=1")
+        rows = list(csv.reader(io.StringIO(body.decode('utf-8-sig'))))
+        expected = User.objects.filter(placed_in__placed_in__placed_in=self.dorm, payed_cost=True)
+        self.assertEqual(rows[0][0], 'شماره دانشجویی')
+        self.assertEqual(sorted(row[0] for row in rows[1:]), sorted(expected.values_list('student_code', flat=True)))
+        self.assertTrue(all(row[4] == self.dorm.name and row[9] == 'بله' for row in rows[1:]))
+
+    def test_occupancy_xlsx(self):
+        body = self.export('room', 'xlsx')
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), Room.objects.count() + 1)
+
+    def test_formula_cells_are_escaped(self):
+        rows = [('=HYPERLINK("http://x","y")', '@cmd', '-1+2', 'ali', -5, None)]
+        body = b''.join(iter_csv(['a', 'b', 'c', 'd', 'e', 'f'], rows)).decode('utf-8-sig')
+        self.assertEqual(list(csv.reader(io.StringIO(body)))[1], ["'=HYPERLINK(\"http://x\",\"y\")", "'@cmd", "'-1+2", 'ali', '-5', ''])
+        with zipfile.ZipFile(io.BytesIO(b''.join(iter_xlsx(['a'], [rows[0][:1]])))) as archive:
+            self.assertIn('<t xml:space="preserve">\'=HYPERLINK', archive.read('xl/worksheets/sheet1.xml').decode())
+
+    def test_chunks_are_keyset_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(iter_export_rows(User.objects.all(), ['student_code', 'placed_in__number'], chunk_size=40))
+        self.assertEqual(len(rows), User.objects.count())
+        self.assertEqual(len(queries), len(rows) // 40 + 1)
+        self.assertNotIn('OFFSET', queries.captured_queries[-1]['sql'])
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class AvailabilityApiTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=1, floors=1, rooms_per_floor=4, students=0)
+        now = timezone.now()
+        OtherInfo.objects.create(start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1))
+        cls.student = User.objects.create_user(username='s', student_code='s', national_code='s', password='!', payed_cost=True)
+        cls.rooms = list(Room.objects.order_by('pk'))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+
+    def get(self, **params):
+        etag = params.pop('etag', None)
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse('room_availability_api'), params, headers=headers)
+
+    def test_unchanged_scope_is_not_modified(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(etag=etag).status_code, 304)
+        cache.clear() #version az DB khunde mishe, na counter cache
+        self.assertEqual(self.get(etag=etag).status_code, 304)
+
+        Room.take_slot(self.rooms[0].pk)
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        #hazf otagh version jadid nemisaze vali ETag avaz mishe
+        etag = response['ETag']
+        self.rooms[3].delete()
+        self.assertEqual(self.get(etag=etag).status_code, 200)
+
+    def test_poll_after_hold_expiry_shows_freed_seat(self):
+        room = self.rooms[0]
+        Room.objects.filter(pk=room.pk).update(capacity=1)
+        RoomAvailability.refresh()
+        RoomHold.place(self.student, room)
+        response = self.get()
+        etag = response['ETag']
+        self.assertEqual(response.json()['rooms'][0]['free_slots'], 0)
+        self.assertEqual(self.get(etag=etag).status_code, 304)
+
+        #bedoon sweep: faghat zaman az payan hold migzare
+        later = timezone.now() + RoomHold.DURATION + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.get(etag=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['rooms'][0]['free_slots'], 1)
+            self.assertFalse(RoomHold.objects.exists())
+            self.assertEqual(self.get(etag=response['ETag']).status_code, 304)
+
+    def test_delta_since_version(self):
+        version = self.get().json()['version']
+        Room.take_slot(self.rooms[0].pk)
+        room = self.rooms[1]
+        room.is_active = False
+        room.save()
+
+        delta = self.get(since=version).json()
+        self.assertEqual(delta['changed'], [[self.rooms[0].pk, 1, 6, 5]])
+        self.assertEqual(delta['removed'], [room.pk])
+        self.assertEqual(self.get(since=delta['version']).json()['changed'], [])
+
+    def test_versions_follow_the_db_counter(self):
+        first = RoomAvailability.next_version()
+        cache.clear()
+        self.assertEqual(RoomAvailability.next_version(), first + 1)
+        self.assertEqual(RoomAvailability.current_version(), first + 1)
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class RoomHoldTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=1, floors=1, rooms_per_floor=1, students=0)
+        Room.objects.update(capacity=1)
+        RoomAvailability.refresh()
+        now = timezone.now()
+        OtherInfo.objects.create(start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1))
+        cls.room = Room.objects.get()
+        cls.first, cls.second = [
+            User.objects.create_user(username=code, student_code=code, national_code=code, password='!', payed_cost=True)
+            for code in ('a', 'b')
+        ]
+
+    def counters(self):
+        room = Room.objects.get()
+        return room.current_occupancy, room.held_count, room.availability.free_slots
+
+    def view_room(self, student):
+        self.client.force_login(student)
+        return self.client.get(reverse('view_room_', args=[self.room.pk]))
+
+    def expire_holds(self):
+        RoomHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_viewing_room_holds_the_last_slot(self):
+        self.assertIsNotNone(self.view_room(self.first).context['hold'])
+        self.assertEqual(self.counters(), (0, 1, 0))
+        self.assertIsNone(self.view_room(self.second).context['hold'])
+        self.assertEqual(self.client.get(reverse('select_room_')).context['rooms'].object_list[0].free_slots, 0)
+
+    def test_expired_hold_is_free_on_read(self):
+        self.view_room(self.first)
+        self.expire_holds()
+        self.client.force_login(self.second)
+        self.assertEqual(self.client.get(reverse('select_room_')).context['rooms'].object_list[0].free_slots, 1)
+        self.assertEqual(self.counters(), (0, 1, 0)) #khundan chizi nemineviseh
+
+        self.assertIsNotNone(self.view_room(self.second).context['hold'])
+        self.assertEqual(list(RoomHold.objects.values_list('user_id', flat=True)), [self.second.pk])
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+    def test_hold_converts_to_booking(self):
+        self.view_room(self.first)
+        self.assertEqual(self.client.get(reverse('book_room_action', args=[self.room.pk])).status_code, 302)
+        self.assertFalse(RoomHold.objects.exists())
+        self.assertEqual(self.counters(), (1, 0, 0))
+        self.assertEqual(User.objects.get(pk=self.first.pk).placed_in_id, self.room.pk)
+
+    def test_sweep_releases_expired_holds(self):
+        self.view_room(self.first)
+        self.assertEqual(RoomHold.release_expired(), 0)
+        self.expire_holds()
+        self.assertEqual(RoomHold.release_expired(), 1)
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class SelectionCohortTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        OtherInfo.objects.create(start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1))
+        later = {'start_selectroom_event': now + timedelta(days=1), 'end_selectroom_event': now + timedelta(days=2)}
+        cls.entry_year = SelectionCohort.objects.create(name="sal 403", kind='entry_year', value='403', priority=1, **later)
+        cls.female = SelectionCohort.objects.create(name="khaharan", kind='gender', value='female', priority=2, **later)
+
+    def signup(self, student_code, gender):
+        return self.client.post(reverse('signup'), {
+            'student_id': student_code, 'national_id': f"0{student_code}", 'first_name': "name", 'last_name': "family",
+            'gender': gender, 'password': 'secret1', 'confirm_password': 'secret1',
+        })
+
+    def test_signup_requires_gender(self):
+        self.assertContains(self.signup('402000001', ''), "نوع خوابگاه را انتخاب کنید.")
+        self.assertFalse(User.objects.exists())
+
+    def test_self_registered_student_joins_gender_cohort(self):
+        self.assertEqual(self.signup('402000001', 'female').status_code, 302)
+        user = User.objects.get(student_code='402000001')
+        self.assertEqual(user.gender, 'female')
+        self.assertEqual(SelectionCohort.window_for(user), self.female)
+        User.objects.filter(pk=user.pk).update(payed_cost=True)
+
+        response = self.client.get(reverse('select_room_'))
+        self.assertTrue(response.context['access_denied'])
+        self.assertIn("زمان انتخاب اتاق هنوز فرا نرسیده است.", response.context['error_messages'])
+
+    def test_resolve_follows_priority(self):
+        self.assertEqual(SelectionCohort.resolve('403000001', 'female'), self.entry_year)
+        self.assertEqual(SelectionCohort.resolve('402000001', 'female'), self.female)
+        self.assertIsNone(SelectionCohort.resolve('402000001', 'male'))
+        self.assertIsNone(SelectionCohort.resolve('402000001', ''))
+
+    def test_students_outside_cohorts_use_the_general_window(self):
+        self.assertEqual(self.signup('402000002', 'male').status_code, 302)
+        user = User.objects.get(student_code='402000002')
+        self.assertIsNone(SelectionCohort.window_error_for(user))
+
+
+@override_settings(FORCE_SCRIPT_NAME=None, LIVE_UPDATES=True)
+class LiveUpdateTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=1, floors=1, rooms_per_floor=2, students=2)
+        now = timezone.now()
+        OtherInfo.objects.create(start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1))
+        cls.student = User.objects.first()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+
+    def test_stream_is_off_under_wsgi(self):
+        #test client WSGI ast: stream nabayad worker ro negah dare
+        self.assertEqual(self.client.get(reverse('availability_stream')).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('select_room_')), 'EventSource(')
+
+    async def test_page_offers_stream_under_asgi(self):
+        await self.async_client.aforce_login(self.student)
+        self.assertContains(await self.async_client.get(reverse('select_room_')), 'EventSource(')
+        with override_settings(LIVE_UPDATES=False):
+            self.assertNotContains(await self.async_client.get(reverse('select_room_')), 'EventSource(')
+
+    async def test_stream_url_keeps_every_filter(self):
+        #query string dakhel <script> nabayad &amp; beshe, vagarna filter haye baadi gom mishan
+        await self.async_client.aforce_login(self.student)
+        block = await Block.objects.afirst()
+        response = await self.async_client.get(reverse('select_room_'), {'block': block.pk, 'floor': 1})
+        url = reverse('availability_stream') + '?' + escapejs(f'block={block.pk}&floor=1')
+        self.assertContains(response, f'new EventSource("{url}")')
+        self.assertNotContains(response, '&amp;floor=')
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class PaymentAndBulkActionTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=2, floors=1, rooms_per_floor=5, students=20)
+        User.objects.update(payed_cost=False, gender='male')
+        cls.admin_user = User.objects.create_superuser(
+            username='admin', student_code='admin', national_code='admin', password='!',
+        )
+        cls.students = list(User.objects.filter(is_staff=False).order_by('pk'))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin_user)
+
+    def upload(self, content, dry_run=False):
+        data = {'file': SimpleUploadedFile('payments.csv', content.encode())}
+        if dry_run:
+            data['dry_run'] = 'on'
+        return self.client.post(reverse('webdorm_admin:myapp_user_reconcile_payments'), data)
+
+    def test_reconciliation_matches_normalized_codes(self):
+        first, second, third = self.students[:3]
+        persian = first.student_code.translate(str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹'))
+        content = (
+            "Student Code,National Code,Paid\n"
+            f"{persian},,\n"
+            f",{second.national_code},1\n"
+            f"{third.student_code},{second.national_code},1\n"
+            "999999999,,1\n"
+        )
+        response = self.upload(content, dry_run=True)
+        self.assertEqual(response.context['report'].marked_paid, [first.student_code, second.student_code])
+        self.assertFalse(User.objects.filter(payed_cost=True).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.upload(content).context['report']
+        self.assertEqual(len(report.unmatched), 1)
+        self.assertEqual(len(report.problems), 1)
+        self.assertIn("مربوط به دو دانشجوی متفاوت است", report.problems[0][1])
+        self.assertEqual(
+            set(User.objects.filter(payed_cost=True).values_list('pk', flat=True)), {first.pk, second.pk},
+        )
+        self.assertEqual(sum(q['sql'].startswith('UPDATE') for q in queries.captured_queries), 1)
+
+    def test_corrupt_xlsx_is_a_form_error(self):
+        data = {'file': SimpleUploadedFile('payments.xlsx', b"student_code,paid\n1,1\n")}
+        response = self.client.post(reverse('webdorm_admin:myapp_user_reconcile_payments'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].errors['file'], ["فایل xlsx معتبر نیست یا خراب است."])
+        self.assertIsNone(response.context['report'])
+
+    def action(self, name, students, **extra):
+        return self.client.post(reverse('webdorm_admin:myapp_user_changelist'), {
+            'action': name, helpers.ACTION_CHECKBOX_NAME: [s.pk for s in students], **extra,
+        })
+
+    def test_release_and_move_keep_counters(self):
+        block = Block.objects.order_by('pk').last()
+        movers = [s for s in self.students if s.placed_in.placed_in_id != block.pk][:6]
+        User.objects.filter(pk__in=[s.pk for s in movers]).update(payed_cost=True)
+
+        self.assertEqual(self.action('move_to_block', movers).status_code, 200) #safhe entekhab block
+        self.action('move_to_block', movers, apply='1', block=block.pk)
+        self.assertEqual(User.objects.filter(pk__in=[s.pk for s in movers], placed_in__placed_in=block).count(), 6)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.action('release_from_room', movers)
+        self.assertFalse(User.objects.filter(pk__in=[s.pk for s in movers], placed_in__isnull=False).exists())
+        self.assertLess(len(queries), 20)
+
+        for room in Room.objects.annotate(real=Count('students')):
+            self.assertEqual(room.current_occupancy, room.real)
+            self.assertEqual(room.availability.occupancy, room.real)
+
+    def test_move_without_room_for_everyone_changes_nothing(self):
+        block = Block.objects.order_by('pk').last()
+        before = dict(User.objects.values_list('pk', 'placed_in_id'))
+        self.action('move_to_block', self.students[:1], apply='1', block=block.pk) #pardakht nakarde
+        self.assertEqual(dict(User.objects.values_list('pk', 'placed_in_id')), before)
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class AvailabilityUpdateTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=1, floors=1, rooms_per_floor=2, students=0)
+        now = timezone.now()
+        OtherInfo.objects.create(start_selectroom_event=now - timedelta(hours=1), end_selectroom_event=now + timedelta(hours=1))
+        cls.room, cls.other_room = Room.objects.order_by('pk')
+        cls.student = User.objects.create_user(username='s', student_code='s', national_code='s', password='!', payed_cost=True)
+
+    def row(self, room):
+        return RoomAvailability.objects.values('occupancy', 'free_slots', 'capacity', 'is_listed', 'block_name', 'version').get(room=room)
+
+    def test_booking_and_moving_update_rows_in_place(self):
+        self.client.force_login(self.student)
+        before = self.row(self.room)['version']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('book_room_action', args=[self.room.pk]))
+        #faghat UPDATE; na DELETE / INSERT (refresh)
+        self.assertFalse([q for q in queries.captured_queries if re.match(r'(DELETE|INSERT).*myapp_roomavailability', q['sql'])])
+        row = self.row(self.room)
+        self.assertEqual((row['occupancy'], row['free_slots']), (1, 5))
+        self.assertGreater(row['version'], before)
+
+        self.client.get(reverse('book_room_action', args=[self.other_room.pk]))
+        self.assertEqual((self.row(self.room)['occupancy'], self.row(self.other_room)['occupancy']), (0, 1))
+
+    def test_admin_edits_refresh_rows(self):
+        self.room.capacity = 3
+        self.room.save()
+        self.assertEqual((self.row(self.room)['capacity'], self.row(self.room)['free_slots']), (3, 3))
+
+        block = self.room.placed_in
+        block.name = "renamed"
+        block.save()
+        self.assertEqual(self.row(self.other_room)['block_name'], "renamed")
+
+        dorm = block.placed_in
+        dorm.is_active = False
+        dorm.save()
+        self.assertFalse(RoomAvailability.objects.filter(is_listed=True).exists())
+
+
+class FilterChoicesCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=2, blocks_per_dorm=1, floors=2, rooms_per_floor=1, students=0)
+        cls.dorm = Dorm.objects.order_by('pk').first()
+
+    def setUp(self):
+        cache.clear()
+        _local_copies.clear()
+
+    def names(self):
+        return {dorm['name']: sorted(block['name'] for block in dorm['blocks']) for dorm in Dorm.filter_choices()['dorms']}
+
+    def test_choices_are_cached(self):
+        Dorm.filter_choices()
+        with self.assertNumQueries(0):
+            self.assertEqual(Dorm.filter_choices()['floors'], [1, 2])
+
+    def test_dorm_and_block_changes_clear_choices(self):
+        self.names()
+        Block.objects.create(name="new", placed_in=self.dorm, floor_count=4, floor_rooms=1, room_costs=1)
+        self.assertEqual(self.names()["dorm 0"], ["block 0", "new"])
+        self.assertEqual(Dorm.filter_choices()['floors'], [1, 2, 3, 4])
+
+        self.dorm.is_active = False
+        self.dorm.save()
+        self.assertNotIn("dorm 0", self.names())
+
+        block = Block.objects.get(placed_in__name="dorm 1")
+        block.is_active = False
+        block.save()
+        self.assertEqual(self.names(), {"dorm 1": []})
+
+    def test_room_changes_clear_floor_numbers(self):
+        self.assertEqual(Room.floor_numbers(), [1, 2])
+        room = Room.objects.filter(floor_number=2).first()
+        room.floor_number = 7
+        room.save()
+        self.assertEqual(Room.floor_numbers(), [1, 2, 7])
+        Room.objects.filter(floor_number=2).delete()
+        self.assertEqual(Room.floor_numbers(), [1, 7])
+
+
+class SettingsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _local_copies.clear()
+        self.start = timezone.now() - timedelta(hours=1)
+        OtherInfo.objects.create(start_selectroom_event=self.start, end_selectroom_event=self.start + timedelta(hours=2))
+
+    def test_instance_is_cached(self):
+        OtherInfo.get_instance()
+        with self.assertNumQueries(0):
+            self.assertEqual(OtherInfo.get_instance().start_selectroom_event, self.start)
+        _local_copies.clear() #worker dige: az cache moshtarak
+        with self.assertNumQueries(0):
+            OtherInfo.get_instance()
+
+    def test_save_clears_cache(self):
+        OtherInfo.get_instance()
+        info = OtherInfo.objects.get()
+        info.end_selectroom_event = self.start
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            info.save()
+        self.assertEqual(len(callbacks), 1) #pak kardan dobare baad az commit
+        self.assertEqual(OtherInfo.get_instance().end_selectroom_event, self.start)
+        self.assertIsNotNone(OtherInfo.get_instance().selection_window_error())
+
+    def test_other_workers_catch_up_after_local_timeout(self):
+        #pak kardan dar worker dige faghat cache moshtarak ro pak mikone
+        OtherInfo.get_instance()
+        OtherInfo.objects.update(end_selectroom_event=self.start)
+        cache.delete(OtherInfo.CACHE_KEY)
+        self.assertNotEqual(OtherInfo.get_instance().end_selectroom_event, self.start)
+        later = time.monotonic() + LOCAL_TIMEOUT + 1
+        with mock.patch('myapp.caching.time.monotonic', return_value=later):
+            self.assertEqual(OtherInfo.get_instance().end_selectroom_event, self.start)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        #3 block ba shomare otagh haye yeksan (101..105): sort rooye number tie dare
+        seed_campus(dorms=1, blocks_per_dorm=3, floors=1, rooms_per_floor=5, students=0)
+
+    def page(self, params, **cursor):
+        query = QueryDict(params, mutable=True)
+        query.update(cursor)
+        return listing_page(query, 4)
+
+    def walk(self, params):
+        page = self.page(params)
+        pages = [[room.pk for room in page]]
+        while page.has_next():
+            page = self.page(params, after=page.next_cursor)
+            pages.append([room.pk for room in page])
+        return pages, page
+
+    def test_after_cursor_visits_every_room_once(self):
+        for params in ('', 'price_sort=expensive', 'capacity_sort=empty'):
+            with self.subTest(params=params):
+                pages, _ = self.walk(params)
+                ordering = listing_ordering(QueryDict(params))
+                expected = list(RoomAvailability.objects.filter(is_listed=True).order_by(*ordering).values_list('pk', flat=True))
+                self.assertEqual([pk for page in pages for pk in page], expected)
+                self.assertEqual([len(page) for page in pages], [4, 4, 4, 3])
+
+    def test_before_cursor_walks_back_to_the_same_pages(self):
+        pages, page = self.walk('price_sort=cheap')
+        back = [[room.pk for room in page]]
+        while page.has_previous():
+            page = self.page('price_sort=cheap', before=page.previous_cursor)
+            back.append([room.pk for room in page])
+        self.assertEqual(back[::-1], pages)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        first = [room.pk for room in self.page('')]
+        for cursor in ('garbage', encode_cursor([101]), encode_cursor(['101', 1])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual([room.pk for room in self.page('', after=cursor)], first)
+
+
+class OccupancyCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=1, floors=1, rooms_per_floor=2, students=0)
+        Room.objects.update(capacity=2)
+        RoomAvailability.refresh()
+        cls.room, cls.other_room = Room.objects.order_by('pk')
+        cls.students = [
+            User.objects.create(username=code, student_code=code, national_code=code, password='!', payed_cost=True)
+            for code in ('a', 'b', 'c')
+        ]
+
+    def occupancy(self, room):
+        room = Room.objects.get(pk=room.pk)
+        return room.current_occupancy, room.availability.occupancy, room.availability.free_slots
+
+    def test_take_slot_is_a_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(Room.take_slot(self.room.pk))
+        self.assertIn('"current_occupancy" < ("myapp_room"."capacity" - "myapp_room"."held_count")', queries.captured_queries[0]['sql'])
+        self.assertTrue(Room.take_slot(self.room.pk))
+        self.assertFalse(Room.take_slot(self.room.pk))
+        self.assertEqual(self.occupancy(self.room), (2, 2, 0))
+
+    def test_full_room_is_refused(self):
+        first, second, third = self.students
+        self.assertTrue(first.move_to_room(self.room))
+        self.assertTrue(second.move_to_room(self.room))
+        self.assertFalse(third.move_to_room(self.room))
+        self.assertIsNone(User.objects.get(pk=third.pk).placed_in_id)
+        self.assertEqual(self.occupancy(self.room), (2, 2, 0))
+
+    def test_move_and_unplace_decrement(self):
+        student = self.students[0]
+        student.move_to_room(self.room)
+        student.move_to_room(self.other_room)
+        self.assertEqual(self.occupancy(self.room), (0, 0, 2))
+        self.assertEqual(self.occupancy(self.other_room), (1, 1, 1))
+        student.move_to_room(None)
+        self.assertEqual(self.occupancy(self.other_room), (0, 0, 2))
+        self.assertFalse(Room.release_slot(self.other_room.pk)) #zir sefr nemire
+
+    def test_move_locks_rooms_before_version_counter(self):
+        #tartib ghofl: otagh ha be tartib pk, counter version yek bar va akhar (bedoon deadlock ba view_room)
+        student = self.students[0]
+        student.move_to_room(self.other_room)
+        RoomHold.place(student, self.room)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(student.move_to_room(self.room))
+        sqls = [q['sql'] for q in queries.captured_queries]
+        counter = [i for i, sql in enumerate(sqls) if sql.startswith('UPDATE "myapp_availabilityversion"')]
+        rooms = [i for i, sql in enumerate(sqls) if '"myapp_room"' in sql]
+        self.assertEqual(len(counter), 1)
+        self.assertLess(max(rooms), counter[0])
+        self.assertEqual(self.occupancy(self.room), (1, 1, 1))
+        self.assertEqual(self.occupancy(self.other_room), (0, 0, 2))
+
+    def test_full_save_keeps_concurrent_move(self):
+        #admin / profile ba noskhe ghadimi karbar save mikonan; jabejayi hamzaman nabayad bargarde
+        stale = User.objects.get(pk=self.students[0].pk)
+        self.assertTrue(User.objects.get(pk=stale.pk).move_to_room(self.room))
+        stale.first_name = "new"
+        stale.save()
+        student = User.objects.get(pk=stale.pk)
+        self.assertEqual((student.first_name, student.placed_in_id), ("new", self.room.pk))
+        self.assertEqual(self.occupancy(self.room), (1, 1, 1))
+
+    def test_reconcile_occupancy(self):
+        User.objects.filter(pk=self.students[0].pk).update(placed_in=self.room)
+        Room.objects.filter(pk=self.other_room.pk).update(current_occupancy=2)
+
+        out = io.StringIO()
+        call_command('reconcile_occupancy', dry_run=True, stdout=out)
+        self.assertIn("2 room(s) out of sync", out.getvalue())
+        self.assertEqual(Room.objects.get(pk=self.room.pk).current_occupancy, 0)
+
+        call_command('reconcile_occupancy', stdout=io.StringIO())
+        self.assertEqual(self.occupancy(self.room), (1, 1, 1))
+        self.assertEqual(self.occupancy(self.other_room), (0, 0, 2))
+
+
+class AllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for gender, rooms in (('male', 2), ('female', 1)):
+            dorm = Dorm.objects.create(name=gender, gender=gender)
+            Block.objects.create(name="A", placed_in=dorm, floor_count=1, floor_rooms=rooms, room_costs=100, default_room_capacity=2)
+        students = [('m', 'male', 5), ('f', 'female', 2), ('x', '', 1)]
+        User.objects.bulk_create(
+            User(username=f"{prefix}{i}", student_code=f"{prefix}{i}", national_code=f"{prefix}{i}", password='!',
+                 payed_cost=True, gender=gender)
+            for prefix, gender, count in students for i in range(count)
+        )
+        User.objects.create(username='unpaid', student_code='unpaid', national_code='unpaid', password='!', gender='male')
+
+    def assertCountersMatch(self):
+        for room in Room.objects.annotate(real=Count('students')):
+            self.assertEqual(room.current_occupancy, room.real)
+            self.assertEqual(room.availability.occupancy, room.real)
+
+    def test_dry_run_saves_nothing(self):
+        #pish namayesh satr ha ro ghofl nemikone (SQLite FOR UPDATE nadare pas khode select_for_update check mishe)
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=QuerySet.select_for_update) as locks:
+            report = allocate_students(dry_run=True)
+        locks.assert_not_called()
+        self.assertEqual(report.placed_count, 6)
+        self.assertFalse(User.objects.filter(placed_in__isnull=False).exists())
+        self.assertEqual(Room.objects.aggregate(n=Sum('current_occupancy'))['n'], 0)
+        self.assertEqual(report.summary_lines()[-1], "پیش‌نمایش: هیچ تغییری ذخیره نشد")
+
+    def test_commit_matches_gender_and_capacity(self):
+        report = allocate_students()
+        self.assertEqual(report.placed_count, 6)
+        self.assertFalse(User.objects.filter(placed_in__isnull=False).exclude(gender=F('placed_in__placed_in__placed_in__gender')).exists())
+        self.assertEqual(report.skipped['اتاق خالی برای آقایان نیست'], 1)
+        self.assertFalse(Room.objects.filter(current_occupancy__gt=F('capacity')).exists())
+        self.assertFalse(User.objects.filter(student_code='unpaid', placed_in__isnull=False).exists())
+        self.assertCountersMatch()
+
+    def test_unknown_gender_is_reported(self):
+        report = allocate_students(dry_run=True)
+        self.assertEqual(report.unknown_gender, ['x0'])
+        self.assertIn("جنسیت این دانشجویان ثبت نشده است: x0", report.summary_lines())
+
+    def test_roommate_groups_share_a_room(self):
+        report = allocate_students(groups=[['m3', 'm4'], ['f0', 'x0']])
+        self.assertEqual(report.assignments[User.objects.get(student_code='m3').pk], report.assignments[User.objects.get(student_code='m4').pk])
+        self.assertEqual(report.skipped['گروه هم‌اتاقی با جنسیت متفاوت یا نامشخص'], 2)
+        self.assertCountersMatch()
+
+
+class ImportStudentsTests(TestCase):
+    def run_import(self, content, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'students.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('import_students', path, workers=1, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_normalizes_and_skips_bad_rows(self):
+        User.objects.create(username='400000003', student_code='x', national_code='x', password='!')
+        out, err = self.run_import(
+            "Student Code,National Code,First Name,Last Name,Gender,Password\n"
+            "۴۰۰۰۰۰۰۰۱,۰۰۱۲۳۴۵۶۷۸,ali,rezaei,Male,\n" #adad farsi
+            "400000002,0012345678,reza,ahmadi,,secret\n" #national_code tekrari dar hamin file
+            "400000003,0012345679,sara,karimi,female,\n" #username gerefte shode
+            "40000,0012345670,mina,amini,,\n"
+            "400000004,0012345671,,amini,,\n"
+            "400000005,0012345672,neda,rahimi,other,\n"
+            "400000006,0012345673,neda,rahimi,female,secret\n"
+        )
+        self.assertIn("2 student(s) created, 5 error(s)", out)
+        for line in (3, 4, 5, 6, 7):
+            self.assertIn(f"row {line}:", err)
+        self.assertIn("username 400000003 is already taken", err)
+
+        first = User.objects.get(student_code='400000001')
+        self.assertEqual((first.username, first.national_code, first.gender), ('400000001', '0012345678', 'male'))
+        self.assertNotEqual(first.password, '0012345678')
+        self.assertTrue(first.check_password('0012345678')) #pish farz: kod melli
+        self.assertTrue(User.objects.get(student_code='400000006').check_password('secret'))
+
+    def test_dry_run_saves_nothing(self):
+        out, err = self.run_import(
+            "student_code,national_code,first_name,last_name\n400000001,0012345678,ali,rezaei\n", dry_run=True,
+        )
+        self.assertIn("1 student(s) validated, 0 error(s)", out)
+        self.assertFalse(User.objects.exists())
+
+
+class BlockProvisioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_campus(dorms=1, blocks_per_dorm=1, floors=3, rooms_per_floor=4, students=24)
+        cls.block = Block.objects.get()
+
+    def test_numbering_schemes(self):
+        for scheme, expected in (('floor_hundreds', [101, 102, 201]), ('floor_thousands', [1001, 1002, 2001]), ('sequential', [1, 2, 3])):
+            with self.subTest(scheme=scheme):
+                block = Block.objects.create(
+                    name=scheme, placed_in=self.block.placed_in, floor_count=2, floor_rooms=2,
+                    room_costs=10, room_numbering=scheme,
+                )
+                self.assertEqual(list(block.room_set.order_by('number').values_list('number', flat=True)[:3]), expected)
+                self.assertEqual(RoomAvailability.objects.filter(block=block).count(), 4)
+
+    def test_clone_copies_room_layout(self):
+        Room.objects.filter(placed_in=self.block, number=101).update(capacity=3, room_cost=99)
+        clone = self.block.clone(name="copy")
+        self.assertEqual(
+            list(clone.room_set.order_by('number').values_list('number', 'capacity', 'room_cost', 'current_occupancy')),
+            [(n, c, cost, 0) for n, c, cost, _ in self.block.room_set.order_by('number').values_list('number', 'capacity', 'room_cost', 'current_occupancy')],
+        )
+        self.assertEqual(RoomAvailability.objects.filter(block=clone).count(), 12)
+
+    def test_update_rooms_is_set_based(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.block.update_rooms(floors=[2, 3], room_cost=500, is_active=False), 8)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "myapp_room" ') for q in queries.captured_queries), 1)
+        self.assertEqual(Room.objects.filter(room_cost=500, is_active=False).count(), 8)
+        self.assertEqual(RoomAvailability.objects.filter(room_cost=500, is_listed=False).count(), 8)
+
+    def test_capacity_cut_below_occupancy_is_refused(self):
+        #har otagh 2 sakin dare
+        with self.assertRaises(ValidationError):
+            self.block.update_rooms(capacity=1, room_cost=7)
+        self.assertFalse(Room.objects.filter(room_cost=7).exists())
+        self.assertEqual(self.block.update_rooms(capacity=2), 12)
+        self.assertEqual(set(RoomAvailability.objects.values_list('capacity', 'free_slots')), {(2, 0)})
+
+
+@override_settings(FORCE_SCRIPT_NAME=None)
+class NoticeFeedTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Notice.objects.bulk_create(Notice(title=f"notice {i}", text="text") for i in range(25))
+        cls.student = User.objects.create_user(username='s', student_code='s', national_code='s', password='!')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+
+    def test_feed_is_paginated(self):
+        response = self.client.get(reverse('dashboard_'))
+        self.assertContains(response, 'class="announcement-card"', count=Notice.FEED_PER_PAGE)
+        self.assertContains(response, 'notice 24')
+        self.assertNotContains(response, 'notice 14<')
+        after = re.search(r'\?after=([\w-]+)', response.content.decode()).group(1)
+        self.assertContains(self.client.get(reverse('dashboard_') + f"?after={after}"), 'notice 14<')
+
+    def test_repeat_load_is_not_modified(self):
+        url = reverse('dashboard_')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries if 'myapp_notice' in q['sql']])
+
+        Notice.objects.first().delete()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_state_is_cached(self):
+        Notice.feed_state()
+        with self.assertNumQueries(0):
+            Notice.feed_state()
+
+    def test_workers_agree_on_feed_token(self):
+        #worker dige (cache mahali khodesh) baraye hamoon dade hamoon token ro misaze
+        token = Notice.feed_state()['token']
+        cache.clear()
+        _local_copies.clear()
+        self.assertEqual(Notice.feed_state()['token'], token)
+
+        notice = Notice.objects.first()
+        notice.text = "edited"
+        notice.save()
+        self.assertNotEqual(Notice.feed_state()['token'], token)
+
+    def test_cached_fragment_skips_notice_query(self):
+        url = reverse('dashboard_')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries.captured_queries if 'myapp_notice' in q['sql']])
+
+
+@override_settings(FORCE_SCRIPT_NAME=None, PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.MD5PasswordHasher', 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+])
+class PasswordUpgradeTests(QueryBudgetMixin, TestCase):
+    #hash ba hasher ghadimi (pbkdf2_sha1) moghe login be hasher aval (md5) upgrade mishe
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create(
+            username='s', student_code='403123456', national_code='s', password=make_password('secret', hasher='pbkdf2_sha1'),
+        )
+
+    def test_upgraded_student_stays_logged_in(self):
+        response = self.client.post(reverse('index_'), {'student_id': '403123456', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(User.objects.get(pk=self.student.pk).password.startswith('md5$'))
+        self.assertEqual(self.client.get(reverse('dashboard_')).status_code, 200)
+
+    def test_last_login_is_flushed_when_due(self):
+        self.client.post(reverse('index_'), {'student_id': '403123456', 'password': 'secret'})
+        self.assertIsNone(User.objects.get(pk=self.student.pk).last_login)
+        with mock.patch('myapp.deferred_writes.FLUSH_INTERVAL', 0):
+            self.client.get(reverse('dashboard_'))
+        self.assertIsNotNone(User.objects.get(pk=self.student.pk).last_login)
+
+    def test_change_password(self):
+        self.client.force_login(self.student)
+        url = reverse('change_password_')
+        response = self.client.post(url, {'old_password': 'wrong', 'new_password': 'new secret', 'confirm_password': 'new secret'})
+        self.assertContains(response, "رمز عبور فعلی اشتباه است.")
+        response = self.client.post(url, {'old_password': 'secret', 'new_password': 'new secret', 'confirm_password': 'new secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(User.objects.get(pk=self.student.pk).check_password('new secret'))
+        self.assertEqual(self.client.get(reverse('dashboard_')).status_code, 200)
+
+    def test_busy_hash_pool_returns_503_without_writes(self):
+        #saf por (queue_limit=0): javab fori 503 + Retry-After, hich write dar DB
+        signup = {
+            'student_id': '403000001', 'national_id': '0012345678', 'first_name': 'ali', 'last_name': 'rezaei',
+            'gender': 'male', 'password': 'secret', 'confirm_password': 'secret',
+        }
+        change = {'old_password': 'secret', 'new_password': 'new secret', 'confirm_password': 'new secret'}
+        password = User.objects.get(pk=self.student.pk).password
+        with mock.patch.object(hashing.pool, 'queue_limit', 0):
+            for url, data, login in ((reverse('signup'), signup, False), (reverse('change_password_'), change, True)):
+                with self.subTest(url=url):
+                    if login:
+                        self.client.force_login(self.student)
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.post(url, data)
+                    self.assertEqual(response.status_code, 503)
+                    self.assertEqual(response['Retry-After'], '5')
+                    self.assertTrue(queries.captured_queries)
+                    writes = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith('SELECT')]
+                    self.assertEqual(writes, [])
+        self.assertFalse(User.objects.filter(student_code='403000001').exists())
+        self.assertEqual(User.objects.get(pk=self.student.pk).password, password)
+
+    def test_upgrade_does_not_overwrite_new_password(self):
+        user = User.objects.get(pk=self.student.pk)
+        old_password = user.password
+        User.objects.filter(pk=user.pk).update(password=make_password('changed'))
+        _save_upgraded_password(user, old_password, make_password('secret'))
+        stored = User.objects.get(pk=user.pk).password
+        self.assertTrue(check_password('changed', stored))
+        self.assertFalse(check_password('secret', stored))
+
+
+@override_settings(FORCE_SCRIPT_NAME=None, METRICS_TOKEN='scrape-token')
+class MetricsEndpointTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='s', student_code='s', national_code='s', password='!')
+        cls.admin_user = User.objects.create_superuser(username='admin', student_code='admin', national_code='admin', password='!')
+
+    def test_only_staff_or_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer scrape-token'}).status_code, 200)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_is_not_accepted(self):
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer '}).status_code, 403)
+
+    def test_prometheus_output(self):
+        self.client.force_login(self.admin_user)
+        self.client.get(reverse('profile_'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        for line in body.splitlines():
+            if not line.startswith('#'):
+                self.assertRegex(line, r'^\w+(\{[^}]*\})? [-+\d.e]+$')
+        self.assertIn('webdorm_requests_total{view="profile_",status="200"}', body)
+        self.assertRegex(body, r'webdorm_db_queries_total\{alias="default"\} [1-9]')
+        self.assertIn('webdorm_request_db_queries_bucket{view="profile_",le="+Inf"}', body)
+        self.assertIn('webdorm_password_hash_queue_limit', body)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRouterTests(SimpleTestCase):
+    def request(self, method='get', session=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.session = session if session is not None else {}
+        return request
+
+    def run_view(self, request):
+        seen = {}
+
+        @replica_reads
+        def view(request):
+            seen['read'] = Room.objects.all().db
+            seen['locking'] = Room.objects.select_for_update().db
+            with primary():
+                seen['cache fill'] = Room.objects.all().db
+            return HttpResponse()
+
+        view(request)
+        return seen
+
+    def test_read_only_views_read_from_replica(self):
+        self.assertEqual(self.run_view(self.request()), {'read': 'replica_1', 'locking': 'default', 'cache fill': 'default'})
+        self.assertEqual(Room.objects.all().db, 'default')
+
+    def test_writes_and_pinned_users_stay_on_primary(self):
+        self.assertEqual(self.run_view(self.request('post'))['read'], 'default')
+        request = self.request()
+        pin_to_primary(request)
+        self.assertIn(PIN_SESSION_KEY, request.session)
+        self.assertEqual(self.run_view(request)['read'], 'default')
+        self.assertEqual(self.run_view(self.request(session={PIN_SESSION_KEY: 0}))['read'], 'replica_1')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_nothing_is_pinned(self):
+        request = self.request()
+        pin_to_primary(request)
+        self.assertEqual(request.session, {})
+        self.assertEqual(self.run_view(request)['read'], 'default')
@@ -1,17 +1,43 @@
+import hashlib
+import json
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate, alogin, aupdate_session_auth_hash, logout
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.decorators import login_required
 from .forms import LoginForm, SignUpForm
-from .models import User, Notice, Room, Dorm, Block ,OtherInfo
-from django.core.paginator import Paginator
-from django.db.models import Count, F ,Max
-from django.utils import timezone
-from django.contrib.auth import update_session_auth_hash
+from .models import GenderChoices, User, Notice, Room, RoomAvailability, RoomHold, Dorm, SelectionCohort
+from .pagination import keyset_paginate
+from .hashing import HashingBusy, run_hash
+from .live import get_hub, publish_rooms
+from .metrics import render_prometheus
+from .routing import pin_to_primary, primary, replica_reads
 from .forms import ChangePasswordForm, UserProfileForm
 from django.contrib import messages
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+from django.template.loader import render_to_string
+
+BUSY_MESSAGE = "سرور در حال حاضر شلوغ است؛ چند ثانیه دیگر دوباره تلاش کنید."
+
+
+def busy_response(request, template_name, context):
+    #pool hash por ast: javab fori 503 ta safhe haye sabok (entekhab otagh) gir nakonan
+    response = render(request, template_name, context, status=503)
+    response['Retry-After'] = '5'
+    return response
 
-def index_page(request):
-    if request.user.is_authenticated:
+
+async def index_page(request):
+    user = await request.auser()
+    if user.is_authenticated:
         return redirect(dashboard_page)
 
     error_message = None
@@ -26,24 +52,22 @@ def index_page(request):
             student_code = form.cleaned_data.get('student_id')
             password = form.cleaned_data.get('password')
 
+            #StudentCodeBackend: yek query rooye student_code, hash dar pool mahdood (modat session az SESSION_COOKIE_AGE)
             try:
-  
-                user_obj = User.objects.get(student_code=student_code)
-                
-   
-                user = authenticate(request, username=user_obj.username, password=password)
-
-                if user is not None:
-                    if user.is_active:
-                        login(request, user)
-  
-                        request.session.set_expiry(15 * 24 * 60 * 60) #15 days
-                        return redirect(dashboard_page)
-                    else:
-                        error_message = "حساب کاربری شما غیرفعال است."
+                user = await aauthenticate(request, student_code=student_code, password=password)
+            except HashingBusy:
+                return busy_response(request, "index.html", {
+                    "error_message": BUSY_MESSAGE,
+                    "student_id_value": student_id_value
+                })
+
+            if user is not None:
+                if user.is_active:
+                    await alogin(request, user)
+                    return redirect(dashboard_page)
                 else:
-                    error_message = "نام کاربری یا رمز عبور اشتباه است با پشتیبانی تماس بگیرید"
-            except User.DoesNotExist:
+                    error_message = "حساب کاربری شما غیرفعال است."
+            else:
                 error_message = "نام کاربری یا رمز عبور اشتباه است با پشتیبانی تماس بگیرید"
         else:
             error_message = "فرمت وارد شده صحیح نیست."
@@ -53,29 +77,36 @@ def index_page(request):
         "student_id_value": student_id_value
     })
 
-def signup_page(request):
+async def signup_page(request):
 
-    if request.user.is_authenticated:
+    user = await request.auser()
+    if user.is_authenticated:
         return redirect(dashboard_page)
 
     errors = {}
     if request.method == "POST":
         form = SignUpForm(request.POST)
-        if form.is_valid():
+        if await sync_to_async(form.is_valid)():
 
-            user = User.objects.create_user(
+            user = User(
                 username=form.cleaned_data['student_id'], 
                 student_code=form.cleaned_data['student_id'],
                 national_code=form.cleaned_data['national_id'],
                 first_name=form.cleaned_data['first_name'],
                 last_name=form.cleaned_data['last_name'],
-                password=form.cleaned_data['password']
+                gender=form.cleaned_data['gender'],
             )
+            try:
+                user.password = await run_hash(make_password, form.cleaned_data['password'])
+            except HashingBusy:
+                return busy_response(request, "sign_up.html", {
+                    "form_data": request.POST,
+                    "errors": {"non_field_errors": [BUSY_MESSAGE]},
+                    "gender_choices": GenderChoices.choices,
+                })
+            await user.asave()
             
-            login(request, user)
-            
-            request.session.set_expiry(15 * 24 * 60 * 60) #login after register 15 days
-            
+            await alogin(request, user, backend='myapp.backends.StudentCodeBackend')
 
             return redirect(dashboard_page)
         else:
@@ -84,55 +115,34 @@ def signup_page(request):
 
     return render(request, "sign_up.html", {
         "form_data": request.POST, 
-        "errors": errors
+        "errors": errors,
+        "gender_choices": GenderChoices.choices,
     })
 
-@login_required(login_url='index_')
-def select_room_page(request):
-    user = request.user
-    config = OtherInfo.get_instance()
-    now = timezone.now()
-    
-    access_denied = False
+def selection_access_errors(user):
     error_messages = []
 
     if not user.payed_cost:
-        access_denied = True
         error_messages.append("هزینه اتاق توسط شما پرداخت نشده است.")
 
-    if config.start_selectroom_event and now < config.start_selectroom_event:
-        access_denied = True
-        error_messages.append("زمان انتخاب اتاق هنوز فرا نرسیده است.")
-    elif config.end_selectroom_event and now > config.end_selectroom_event:
-        access_denied = True
-        error_messages.append("مهلت انتخاب اتاق به پایان رسیده است.")
+    window_error = SelectionCohort.window_error_for(user) #baze zamani goroh daneshjoo (cache shode)
+    if window_error:
+        error_messages.append(window_error)
 
-    if access_denied:
-        return render(request, "select_room.html", {
-            "access_denied": True,
-            "error_messages": error_messages
-        })
-    #get parametrs from url
-    dorm_id = request.GET.get('dorm')
-    block_id = request.GET.get('block')
-    floor = request.GET.get('floor')
-    price_sort = request.GET.get('price_sort', '')
-    capacity_sort = request.GET.get('capacity_sort', '')
-
-    #find max floor
-    max_floors_data = Block.objects.aggregate(max_f=Max('floor_count'))
-    max_floors = max_floors_data.get('max_f') or 0
-    floor_list = list(range(1, max_floors + 1)) #convert to list
-
-    rooms_qs = Room.objects.filter(is_active=True).annotate(
-        current_count=Count('students'),#num of students is not property of sql
-        free_slots=F('capacity') - Count('students') #ظرفیت خالی
+    return error_messages
+
+
+def listing_scope(params):
+    #(dorm, block, floor) az url; meghdar na adadi nadide gerefte mishe
+    return tuple(
+        int(value) if value.isdigit() else None
+        for value in (params.get('dorm', ''), params.get('block', ''), params.get('floor', ''))
     )
 
-    #اضافه شدن فیلتر به شرط های کوئری
-    if dorm_id: rooms_qs = rooms_qs.filter(placed_in__placed_in_id=dorm_id)
-    if block_id: rooms_qs = rooms_qs.filter(placed_in_id=block_id)
-    if floor: rooms_qs = rooms_qs.filter(floor_number=floor)
+
+def listing_ordering(params):
+    price_sort = params.get('price_sort', '')
+    capacity_sort = params.get('capacity_sort', '')
 
     ordering = []
     #apply sortong by ....
@@ -147,38 +157,171 @@ def select_room_page(request):
         ordering.append('-room_cost')
 
     ordering.append('number')
-    rooms_qs = rooms_qs.order_by(*ordering)
+    ordering.append('pk') #number beyn block ha tekrari ast; pk cursor ro yekta mikone
+    return ordering
+
 
-    paginator = Paginator(rooms_qs, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def listing_page(params, per_page=20):
+    #faghat az jadval RoomAvailability (bedoon join ba block / dorm / user)
+    rooms_qs = RoomAvailability.in_scope(RoomAvailability.objects.filter(is_listed=True), *listing_scope(params))
+
+    #safhe bandi cursor-i: bedoon COUNT kol va OFFSET, safhe N ham mesl safhe 1 hazine dare
+    page_obj = keyset_paginate(
+        rooms_qs, listing_ordering(params), per_page,
+        after=params.get('after'),
+        before=params.get('before'),
+    )
+    #expire tanbal: hold monghazi ja ro por neshoon nade (bedoon write; view_room / rezerv khodeshon azadesh mikonan)
+    if len(page_obj):
+        expired = RoomHold.expired_counts([room.pk for room in page_obj])
+        for room in page_obj:
+            room.free_slots += expired.get(room.pk, 0)
+    return page_obj
+
+
+@login_required(login_url='index_')
+@replica_reads
+def select_room_page(request):
+    error_messages = selection_access_errors(request.user)
+    if error_messages:
+        return render(request, "select_room.html", {
+            "access_denied": True,
+            "error_messages": error_messages
+        })
+
+    page_obj = listing_page(request.GET)
+    choices = Dorm.filter_choices() #cache shode; ba save / delete khabgah va block pak mishe
 
     return render(request, "select_room.html", {
         "rooms": page_obj,
-        "dorms": Dorm.objects.filter(is_active=True),
-        "blocks": Block.objects.filter(is_active=True),
-        "floor_list": floor_list,
+        "dorms": choices['dorms'],
+        "floor_list": choices['floors'],
+        "live_updates": live_updates_enabled(request),
         "access_denied": False
     })
 
+
+AVAILABILITY_DELTA_LIMIT = 500
+
+
 @login_required(login_url='index_')
+def room_availability_api(request):
+    """
+    JSON hamoon list safhe entekhab otagh (filter / sort / cursor yeksan).
+    ETag = akharin version + tedad otagh haye hamoon filter: ta vaghti otaghi dar filter avaz nashe 304 bedoon query otagh ha.
+    hold monghazi dar filter aval sweep mishe (version jadid), pas ETag ghadimi baad az payan hold 304 nemigire.
+    ?since=<version>: faghat otagh haye taghir karde baad az oon version (changed: [id, occupancy, capacity, free_slots]).
+    """
+    error_messages = selection_access_errors(request.user)
+    if error_messages:
+        return JsonResponse({"errors": error_messages}, status=403)
+
+    scope = listing_scope(request.GET)
+    version, count, updated_at, next_expiry = RoomAvailability.scope_state(*scope)
+    if next_expiry is not None and next_expiry <= timezone.now():
+        #hold monghazi dar filter: sweep rooye khundan version jadid misaze ta ETag ghadimi ja ye azad shode ro penhan nakone
+        RoomHold.release_expired(room_ids=RoomAvailability.in_scope(RoomAvailability.objects.all(), *scope).values('pk'))
+        version, count, updated_at, next_expiry = RoomAvailability.scope_state(*scope, refresh=True)
+    etag = quote_etag(f"{version}-{count}")
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        since = request.GET.get('since', '')
+        if since.isdigit():
+            response = JsonResponse(availability_delta(scope, int(since), version))
+        else:
+            page_obj = listing_page(request.GET)
+            response = JsonResponse({
+                "version": version,
+                "rooms": [
+                    {
+                        "id": room.pk, "number": room.number, "dorm": room.dorm_name, "block": room.block_name,
+                        "floor": room.floor_number, "cost": room.room_cost, "capacity": room.capacity,
+                        "occupancy": room.occupancy, "free_slots": room.free_slots,
+                    }
+                    for room in page_obj
+                ],
+                "next": page_obj.next_cursor if page_obj.has_next() else None,
+                "previous": page_obj.previous_cursor if page_obj.has_previous() else None,
+            })
+
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    #private: har bar ba If-None-Match check mishe
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def live_updates_enabled(request):
+    #ba WSGI stream bi payan ye worker ro ta abad negah midare; pas faghat ba ASGI
+    return settings.LIVE_UPDATES and isinstance(request, ASGIRequest)
+
+
+@login_required(login_url='index_')
+async def availability_stream(request):
+    #Server-Sent Events: taghir zarfiat otagh haye hamoon filter safhe entekhab otagh (faghat ba ASGI)
+    if not live_updates_enabled(request):
+        #204: EventSource dobare vasl nemishe
+        return HttpResponse(status=204)
+    user = await request.auser()
+    error_messages = await sync_to_async(selection_access_errors)(user)
+    if error_messages:
+        return JsonResponse({"errors": error_messages}, status=403)
+
+    hub = get_hub()
+    subscription = hub.subscribe(listing_scope(request.GET))
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                rooms = await subscription.wait(settings.LIVE_HEARTBEAT_SECONDS)
+                if rooms:
+                    yield f"event: rooms\ndata: {json.dumps(rooms)}\n\n"
+                else:
+                    yield ": ping\n\n" #proxy ha connection bikar ro nabandan
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' #nginx buffer nakone
+    return response
+
+
+def availability_delta(scope, since, version):
+    changed = list(
+        RoomAvailability.in_scope(RoomAvailability.objects.all(), *scope)
+        .filter(version__gt=since)
+        .order_by('pk')
+        .values_list('pk', 'occupancy', 'capacity', 'free_slots', 'is_listed')[:AVAILABILITY_DELTA_LIMIT + 1]
+    )
+    if len(changed) > AVAILABILITY_DELTA_LIMIT:
+        #taghirat ziad: client bayad list kamel ro begire
+        return {"version": version, "reset": True}
+    return {
+        "version": version,
+        "changed": [[pk, occupancy, capacity, free_slots] for pk, occupancy, capacity, free_slots, listed in changed if listed],
+        "removed": [pk for pk, _, _, _, listed in changed if not listed],
+    }
+
+@login_required(login_url='index_')
+@replica_reads
 def view_room(request,pk):
     #دانشجویان فقط در زمان انتخاب اتاق میتوانند اتاق هارا ببیننذ
     user = request.user
-    room = get_object_or_404(Room,pk=pk)
-    config = OtherInfo.get_instance()
-    now  = timezone.now()
+    #template esm block va khabgah ro neshoon mide
+    room = get_object_or_404(Room.objects.select_related('placed_in__placed_in'), pk=pk)
 
     if not user.payed_cost:
         messages.error(request, "شما هنوز هزینه خوابگاه را پرداخت نکرده‌اید و مجاز به رزرو نیستید.")
         return redirect('select_room_')
 
-    if config.start_selectroom_event and now < config.start_selectroom_event:
-        messages.error(request, "زمان انتخاب اتاق هنوز فرا نرسیده است.")
-        return redirect('select_room_')
-    
-    if config.end_selectroom_event and now > config.end_selectroom_event:
-        messages.error(request, "مهلت انتخاب اتاق به پایان رسیده است.")
+    window_error = SelectionCohort.window_error_for(user) #baze zamani goroh daneshjoo (cache shode)
+    if window_error:
+        messages.error(request, window_error)
         return redirect('select_room_')
 
     if not room.is_active:
@@ -189,10 +332,16 @@ def view_room(request,pk):
     
     if room:
         roommates = room.students.all()
+
+    #baz kardan safhe tayid yek ja ro baraye chand daghighe negah midare
+    hold = None
+    if user.placed_in_id != room.pk:
+        hold = RoomHold.place(user, room)
     
     return render(request, "view_room.html", {
         "room": room,
-        "roommates": roommates
+        "roommates": roommates,
+        "hold": hold,
     })
 
 @login_required(login_url='index_')
@@ -200,20 +349,14 @@ def book_room(request, pk):
     user = request.user
     room = get_object_or_404(Room, pk=pk)
     
-    config = OtherInfo.get_instance()
-    now = timezone.now()
 
-    
     if not user.payed_cost:
         messages.error(request, "شما هنوز هزینه خوابگاه را پرداخت نکرده‌اید و مجاز به رزرو نیستید.")
         return redirect('select_room_')
 
-    if config.start_selectroom_event and now < config.start_selectroom_event:
-        messages.error(request, "زمان انتخاب اتاق هنوز فرا نرسیده است.")
-        return redirect('select_room_')
-    
-    if config.end_selectroom_event and now > config.end_selectroom_event:
-        messages.error(request, "مهلت انتخاب اتاق به پایان رسیده است.")
+    window_error = SelectionCohort.window_error_for(user) #baze zamani goroh daneshjoo (cache shode)
+    if window_error:
+        messages.error(request, window_error)
         return redirect('select_room_')
 
 
@@ -221,20 +364,23 @@ def book_room(request, pk):
         messages.error(request, "این اتاق غیرفعال شده است.")
         return redirect('select_room_')
 
-    if room.current_occupancy >= room.capacity:
+    #check zarfiat va sabt dar yek update atomic anjam mishe
+    old_room_id = user.placed_in_id
+    if not user.move_to_room(room):
         messages.error(request, "متاسفانه ظرفیت این اتاق همین الان تکمیل شد.")
         return redirect('select_room_')
-
-    user.placed_in = room
-    user.save()
+    publish_rooms([room.pk, old_room_id])
+    pin_to_primary(request) #safhe haye baadi rezerv khodesh ro bebinan (replica momkene aghab bashe)
 
     messages.success(request, f"اتاق {room.number} با موفقیت برای شما رزرو شد.")
     return redirect('dashboard_')
 
 @login_required(login_url='index_') 
+@replica_reads
 def my_room_page(request):
     user = request.user
-    room = user.placed_in  #room
+    #otagh ba block va khabgahesh dar yek query (template har se ro neshoon mide)
+    room = Room.objects.select_related('placed_in__placed_in').filter(pk=user.placed_in_id).first() if user.placed_in_id else None
     roommates = []
     
     if room:
@@ -246,13 +392,43 @@ def my_room_page(request):
         "roommates": roommates
     })
 
+def notice_feed_html(state, after, before):
+    #html ye safhe az etelaeye ha; kelid ba token feed avaz mishe pas pak kardan lazem nist
+    page_key = hashlib.md5(f"{after}:{before}".encode()).hexdigest()
+    key = f"{Notice.FEED_CACHE_KEY}:{state['token']}:{page_key}"
+    html = cache.get(key)
+    if html is None:
+        with primary():
+            page_obj = keyset_paginate(Notice.objects.all(), ['-pk'], Notice.FEED_PER_PAGE, after=after, before=before)
+            html = render_to_string("patterns/notice_feed.html", {"page_obj": page_obj})
+        cache.set(key, html, Notice.FEED_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
 @login_required(login_url='index_') 
+@replica_reads
 def dashboard_page(request):
-    notices = Notice.objects.all()
-    context = {
-        "notices":notices,
-    }
-    return render(request, "dashboard.html",context)
+    #safhe aval baad az login: ETag az noskhe feed + karbar; 304 bedoon query etelaeye va bedoon render
+    user = request.user
+    state = Notice.feed_state()
+    after = request.GET.get('after', '')
+    before = request.GET.get('before', '')
+    fingerprint = f"{state['token']}:{after}:{before}:{user.pk}:{user.get_full_name()}"
+    etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+    last_modified = int(state['built_at'].timestamp())
+
+    #payam haye flash (masalan baad az rezerv otagh) bayad neshoon dade beshan
+    response = None
+    if not len(messages.get_messages(request)):
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render(request, "dashboard.html", {
+            "notice_feed": notice_feed_html(state, after, before),
+        })
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required(login_url='index_') 
 def profile_view(request):
@@ -275,25 +451,48 @@ def profile_view(request):
     return render(request, 'profile.html', {'form': form})
 
 @login_required(login_url='index_') 
-def change_password(request):
+async def change_password(request):
+    user = await request.auser()
     if request.method == 'POST':
-        form = ChangePasswordForm(request.user, request.POST)
-        if form.is_valid():
-            user = request.user
-            new_password = form.cleaned_data['new_password']
-            user.set_password(new_password)
-            user.save()
-            
-            # ino ai goft niaz darim chon onjori test kardim karbar logout mishod !!!
-            update_session_auth_hash(request, user)
-            
-            messages.success(request, "رمز عبور شما با موفقیت تغییر کرد.")
-            return redirect('profile_')
+        try:
+            #faghat hash dar pool; form va ORM dar thread khode request (connection haye pool modiriat nemishan)
+            old_password_valid = await run_hash(check_password, request.POST.get('old_password', ''), user.password)
+            form = ChangePasswordForm(user, request.POST, old_password_valid=old_password_valid)
+            if await sync_to_async(form.is_valid)():
+                user.password = await run_hash(make_password, form.cleaned_data['new_password'])
+                await user.asave(update_fields=['password'])
+
+                # ino ai goft niaz darim chon onjori test kardim karbar logout mishod !!!
+                #request.user lazy ast va ba ramz jadid session ro flush mikard; hamoon user auser ro midim
+                request.user = user
+                await aupdate_session_auth_hash(request, user)
+
+                messages.success(request, "رمز عبور شما با موفقیت تغییر کرد.")
+                return redirect('profile_')
+        except HashingBusy:
+            #base_dashboard request.user ro mikhune (sync)
+            response = await sync_to_async(render)(request, 'change_password.html', {
+                'form': ChangePasswordForm(user),
+                'busy_message': BUSY_MESSAGE,
+            }, status=503)
+            response['Retry-After'] = '5'
+            return response
     else:
-        form = ChangePasswordForm(request.user)
+        form = ChangePasswordForm(user)
 
-    return render(request, 'change_password.html', {'form': form})
+    return await sync_to_async(render)(request, 'change_password.html', {'form': form})
 
 def logout_user(request):
     logout(request)
-    return redirect('index_')
\ No newline at end of file
+    return redirect('index_')
+
+
+def metrics_view(request):
+    #format Prometheus; scraper ba token, admin ba session
+    token = settings.METRICS_TOKEN
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")
+    )
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 import platform
 import os
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'myapp.User'
 
 MIDDLEWARE = [
+    'myapp.metrics.MetricsMiddleware', #aval az hame ta zaman kol request ro andaze begire
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,7 +61,7 @@ ROOT_URLCONF = 'webdorm.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'myapp.metrics.TimedDjangoTemplates', #DjangoTemplates + zaman render baraye /metrics
         'DIRS': [os.path.join(BASE_DIR,'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -101,6 +102,31 @@ else:
         }
     }
 
+#replica haye faghat-khundani (myapp/routing.py): DATABASE_REPLICAS=host1,host2 (MySQL) ya esm file (SQLite,
+# baraye test local: copy az db.sqlite3). safhe haye khundani daneshjoo va changelist admin az inja khunde mishan.
+REPLICA_DATABASES = []
+for i, location in enumerate(config("DATABASE_REPLICAS", default="", cast=Csv())):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'].endswith('sqlite3'):
+        replica['NAME'] = BASE_DIR / location
+    else:
+        replica['HOST'] = location
+    DATABASES[f'replica_{i + 1}'] = replica
+    REPLICA_DATABASES.append(f'replica_{i + 1}')
+DATABASE_ROUTERS = ['myapp.routing.ReplicaRouter']
+#baad az rezerv / taghir admin chand sanie khundan karbar az primary (read-your-writes)
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=10, cast=int)
+
+
+# Cache
+# baraye chand worker ye backend moshtarak (redis / memcached) ro az .env tanzim konid
+# (ba LocMem har worker cache khodesh ro dare: feed etelaeye ha ta Notice.FEED_STATE_TIMEOUT dir be rooz mishe)
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config("CACHE_LOCATION", default="webdorm"),
+    }
+}
 
 
 # Password validation
@@ -133,6 +159,28 @@ if not system == "Windows":
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
 
+AUTHENTICATION_BACKENDS = [
+    'myapp.backends.StudentCodeBackend', #login daneshjoo ba shomare daneshjoyi
+    'django.contrib.auth.backends.ModelBackend', #login admin ba username
+]
+
+SESSION_COOKIE_AGE = 15 * 24 * 60 * 60 #15 days (bejaye set_expiry dar har login)
+
+#pool mahdood hash ramz (myapp/hashing.py); bishtar az QUEUE_LIMIT darkhast hamzaman -> javab 503 "dobare talash konid"
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=2, cast=int)
+PASSWORD_HASH_QUEUE_LIMIT = config("PASSWORD_HASH_QUEUE_LIMIT", default=16, cast=int)
+
+#SSE zarfiat otagh ha (myapp/live.py), faghat ba server ASGI (webdorm/asgi.py); ba WSGI khamoosh mimune. baraye chand worker: LIVE_HUB_BACKEND=myapp.live.RedisHub va LIVE_HUB_LOCATION=redis://...
+LIVE_UPDATES = config("LIVE_UPDATES", default=False, cast=bool)
+LIVE_HUB_BACKEND = config("LIVE_HUB_BACKEND", default="myapp.live.LocalHub")
+LIVE_HUB_LOCATION = config("LIVE_HUB_LOCATION", default="")
+LIVE_HEARTBEAT_SECONDS = config("LIVE_HEARTBEAT_SECONDS", default=25, cast=int)
+
+#/metrics (Prometheus): karbar staff ya header "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+#query haye kond tar az in (millisecond) ba stack dar logger webdorm.slow_queries; 0 = khamoosh
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=0, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/